@@ -0,0 +1,9 @@
+"""
+Benchmarks for the ``lass_utils`` package.
+
+These are not part of the test suite; run individual benchmarks as
+modules from the repository root, for example::
+
+    python -m benchmarks.date_normalise
+
+"""
@@ -0,0 +1,61 @@
+"""
+Benchmarks the start-up cost of declaring attachable models with
+:meth:`lass_utils.mixins.AttachableMixin.make_model`, comparing eager
+construction with lazy construction (and the cost of then building
+the lazy models).
+
+"""
+
+import os
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testsettings')
+
+from django.db import models
+
+from lass_utils.mixins import AttachableMixin
+from lass_utils.mixins.attachable import build_pending_models
+
+
+class BenchmarkAttachable(models.Model, AttachableMixin):
+    """An abstract attachable with a handful of fields."""
+    key = models.CharField(max_length=100)
+    value = models.TextField()
+    order = models.IntegerField()
+
+    class Meta(object):
+        abstract = True
+        app_label = 'benchmarks'
+
+
+def declare(mode, count):
+    """Declares count attachables in the given mode, returning the
+    time taken in seconds.
+
+    """
+    start = time.time()
+    for i in xrange(count):
+        BenchmarkAttachable.make_model(
+            '{0}Target{1}'.format(mode.capitalize(), i),
+            app='benchmarks',
+            lazy=(mode == 'lazy')
+        )
+    return time.time() - start
+
+
+def main(count=300):
+    """Declares attachables eagerly and lazily and prints the times."""
+    eager = declare('eager', count)
+    lazy = declare('lazy', count)
+    start = time.time()
+    build_pending_models()
+    build = time.time() - start
+
+    print '{0} attachable/target pairs'.format(count)
+    print '{0:<24} {1:8.2f} ms'.format('eager declaration', eager * 1e3)
+    print '{0:<24} {1:8.2f} ms'.format('lazy declaration', lazy * 1e3)
+    print '{0:<24} {1:8.2f} ms'.format('building lazy models', build * 1e3)
+
+
+if __name__ == '__main__':
+    main()
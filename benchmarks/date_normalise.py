@@ -0,0 +1,58 @@
+"""
+Benchmarks :func:`lass_utils.view_decorators.date_normalise` on each of
+the argument shapes it accepts, as well as on invalid dates.
+
+"""
+
+import datetime
+import os
+import timeit
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testsettings')
+
+from django.http import Http404
+
+from lass_utils.view_decorators import date_normalise
+
+
+@date_normalise
+def view(request, date):
+    """A view that does nothing with its date."""
+    return date
+
+
+CASES = (
+    ('start', dict(start=datetime.datetime(1993, 2, 13, 13, 50))),
+    ('year/month/day', dict(year='1993', month='02', day='13')),
+    ('year/month', dict(year='1993', month='02')),
+    ('year/week/weekday', dict(year='1993', week='06', weekday='6')),
+    ('year/week', dict(year='1993', week='06')),
+    ('invalid day', dict(year='1993', month='02', day='30')),
+    ('malformed', dict(year='1993', month='feb')),
+)
+
+
+def run_case(kwargs):
+    """Calls the view once with the given arguments."""
+    try:
+        view(None, **kwargs)
+    except Http404:
+        pass
+
+
+def main(number=100000, repeat=3):
+    """Runs every case and prints the best time per call."""
+    for name, kwargs in CASES:
+        best = min(timeit.repeat(
+            lambda: run_case(kwargs),
+            number=number,
+            repeat=repeat
+        ))
+        print '{0:<20} {1:8.3f} us/call'.format(
+            name,
+            best / number * 1e6
+        )
+
+
+if __name__ == '__main__':
+    main()
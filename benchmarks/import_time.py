@@ -0,0 +1,218 @@
+"""
+Benchmarks the cost of importing ``lass_utils`` and its most used
+modules in a fresh interpreter, to keep start-up cost from creeping
+back up.
+
+Each module is imported in its own subprocess, several times over,
+keeping the best time.  On Pythons with ``-X importtime`` (3.7 and
+later) the cumulative time it reports is used; otherwise the import
+is timed inside the subprocess.  The number of modules each import
+loads is reported too, as it is steadier than the time.
+
+Run from the repository root::
+
+    python -m benchmarks.import_time
+
+Results are compared with the committed baseline,
+``benchmarks/import_time_baseline.json``, and the run fails if any
+module got much slower or loads more modules than it did.  Module
+counts carry over between machines; times only roughly, so refresh
+the baseline (with ``--output``) when moving to a new machine or once
+an increase is accepted::
+
+    python -m benchmarks.import_time \\
+        --output=benchmarks/import_time_baseline.json
+
+"""
+
+import json
+import optparse
+import os
+import subprocess
+import sys
+
+
+MODULES = (
+    'lass_utils',
+    'lass_utils.view_decorators',
+    'lass_utils.time_utils',
+    'lass_utils.mixins',
+    'lass_utils.mixins.date_range',
+    'lass_utils.models',
+    'lass_utils.mixins.effective_range',
+)
+
+#: The results file compared with by default.
+BASELINE = os.path.join(os.path.dirname(__file__), 'import_time_baseline.json')
+
+# Times an import inside the subprocess, printing the seconds taken
+# and the number of modules loaded.
+_TIMER = (
+    'import sys, time\n'
+    'before = len(sys.modules)\n'
+    'start = time.time()\n'
+    'import {0}\n'
+    'elapsed = time.time() - start\n'
+    'sys.stdout.write("%r %d\\n" % (elapsed, len(sys.modules) - before))\n'
+)
+
+# Counts the modules an import loads, alongside -X importtime.
+_COUNTER = (
+    'import sys\n'
+    'before = len(sys.modules)\n'
+    'import {0}\n'
+    'sys.stdout.write("%d\\n" % (len(sys.modules) - before))\n'
+)
+
+
+def has_importtime():
+    """Returns whether this Python supports ``-X importtime``."""
+    return sys.version_info >= (3, 7)
+
+
+def _environment():
+    """Returns the environment for the subprocesses."""
+    environment = dict(os.environ)
+    environment.setdefault('DJANGO_SETTINGS_MODULE', 'testsettings')
+    path = [os.getcwd()]
+    if environment.get('PYTHONPATH'):
+        path.append(environment['PYTHONPATH'])
+    environment['PYTHONPATH'] = os.pathsep.join(path)
+    return environment
+
+
+def import_once(module):
+    """Imports a module in a fresh interpreter, returning the seconds
+    taken and the number of modules loaded.
+
+    """
+    if not has_importtime():
+        output = subprocess.check_output(
+            [sys.executable, '-c', _TIMER.format(module)],
+            env=_environment()
+        )
+        seconds, modules = output.split()
+        return float(seconds), int(modules)
+
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', _COUNTER.format(module)],
+        env=_environment(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    output, report = process.communicate()
+    if process.returncode:
+        raise RuntimeError(report)
+    # Lines look like 'import time: self | cumulative | name', with the
+    # requested module's own line after those of everything it imports.
+    cumulative = None
+    for line in report.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            cumulative = int(fields[1])
+    return cumulative / 1e6, int(output)
+
+
+def run(modules, repeat):
+    """Measures each module, printing and returning the results."""
+    results = []
+    for module in modules:
+        samples = [import_once(module) for _ in range(repeat)]
+        seconds = min(sample[0] for sample in samples)
+        loaded = min(sample[1] for sample in samples)
+        results.append(dict(name=module, seconds=seconds, modules=loaded))
+        sys.stdout.write('{0:<36} {1:10.2f} ms {2:5} modules\n'.format(
+            module,
+            seconds * 1e3,
+            loaded
+        ))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints each result against the matching baseline result,
+    returning the number of regressions beyond threshold (a ratio).
+
+    """
+    old = dict((result['name'], result) for result in baseline['results'])
+    regressions = 0
+    for result in results:
+        before = old.get(result['name'])
+        if before is None:
+            continue
+        ratio = result['seconds'] / max(before['seconds'], 1e-9)
+        flags = []
+        if ratio > threshold:
+            flags.append('SLOWER')
+        if result['modules'] > before['modules']:
+            flags.append('MORE MODULES')
+        regressions += bool(flags)
+        sys.stdout.write('{0:<36} {1:8.2f}x {2:5} -> {3:<5} {4}\n'.format(
+            result['name'],
+            ratio,
+            before['modules'],
+            result['modules'],
+            ' '.join(flags)
+        ))
+    return regressions
+
+
+def main(argv=None):
+    """Entry point; see the module docstring."""
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option(
+        '--repeat',
+        type='int',
+        default=5,
+        help='imports per module; the best time is kept'
+    )
+    parser.add_option(
+        '--only',
+        help='comma-separated names of modules to import'
+    )
+    parser.add_option('--output', help='file to write results to')
+    parser.add_option(
+        '--baseline',
+        default=BASELINE,
+        help='results file to compare with (default: the committed '
+             'baseline; give an empty name to skip comparing)'
+    )
+    parser.add_option(
+        '--threshold',
+        type='float',
+        default=1.5,
+        help='slowdown ratio counted as a regression'
+    )
+    options, _ = parser.parse_args(argv)
+
+    # Refreshing the baseline replaces it rather than comparing with it.
+    baseline = None
+    if options.baseline and not (
+        options.output
+        and os.path.abspath(options.output)
+        == os.path.abspath(options.baseline)
+    ):
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    modules = options.only.split(',') if options.only else MODULES
+    results = run(modules, options.repeat)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(
+                dict(python=sys.version.split()[0], results=results),
+                output,
+                indent=2,
+                separators=(',', ': '),
+                sort_keys=True
+            )
+            output.write('\n')
+    if baseline is not None:
+        if compare(results, baseline, options.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
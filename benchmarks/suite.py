@@ -0,0 +1,311 @@
+"""
+Benchmark suite for the hot paths in ``lass_utils``.
+
+Each benchmark is run against generated fixtures of one or more sizes
+in the in-memory sqlite database from ``testsettings.py``, and the
+wall time and number of queries per operation are recorded.  Results
+can be saved as JSON and compared against a previous run::
+
+    python -m benchmarks.suite --sizes 1e2,1e4,1e6 --output new.json
+    python -m benchmarks.suite --baseline new.json
+
+"""
+
+import datetime
+import json
+import optparse
+import os
+import platform
+import sys
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testsettings')
+
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection
+
+from lass_utils import generators
+from lass_utils.mixins import EffectiveRangeMixin
+from lass_utils.models import Type
+from benchmarks import date_normalise as date_normalise_benchmark
+
+
+DEFAULT_SIZES = (100, 1000, 10000)
+
+# Benchmarks whose cost does not depend on the fixture size are only
+# run at the smallest size.
+SIZE_INDEPENDENT = ('date_normalise',)
+
+EPOCH = generators.DEFAULT_START
+
+
+## Fixture models ##
+
+class BenchmarkType(Type):
+    """A concrete Type."""
+
+    class Meta(object):
+        app_label = 'benchmarks'
+
+
+class BenchmarkRange(EffectiveRangeMixin):
+    """A concrete EffectiveRangeMixin model."""
+
+    class Meta(EffectiveRangeMixin.Meta):
+        abstract = False
+        app_label = 'benchmarks'
+
+
+FIXTURE_MODELS = (BenchmarkType, BenchmarkRange)
+
+
+def create_tables():
+    """Creates the tables for the fixture models."""
+    cursor = connection.cursor()
+    for model in FIXTURE_MODELS:
+        statements, _ = connection.creation.sql_create_model(
+            model,
+            no_style()
+        )
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def populate(size):
+    """Empties the fixture tables and fills them with size rows each.
+
+    The ranges last about an hour each, with some overlapping and
+    some gaps between them.
+
+    """
+    for model in FIXTURE_MODELS:
+        model.objects.all().delete()
+    generators.generate_types(BenchmarkType, size, seed=0)
+    generators.generate_effective_ranges(
+        BenchmarkRange,
+        size,
+        start=EPOCH,
+        duration=datetime.timedelta(hours=1),
+        overlap_ratio=0.2,
+        gap_ratio=0.1,
+        open_ratio=1.0,
+        seed=0
+    )
+
+
+## Benchmarks ##
+
+# Each benchmark takes the fixture size and returns a function
+# performing one operation.
+
+def type_get_hit(size):
+    """Type.get by name, with the type already cached."""
+    name = 'type{0}'.format(size // 2)
+    BenchmarkType.get(name)
+    return lambda: BenchmarkType.get(name)
+
+
+def type_get_miss(size):
+    """Type.get by name, with an empty cache."""
+    name = 'type{0}'.format(size // 2)
+
+    def operation():
+        cache.clear()
+        BenchmarkType.get(name)
+    return operation
+
+
+def in_range(size):
+    """ERQuerySet.in_range over a day in the middle of the fixture."""
+    start = EPOCH + datetime.timedelta(hours=size // 2)
+    end = start + datetime.timedelta(days=1)
+    return lambda: list(BenchmarkRange.objects.in_range(start, end))
+
+
+def at(size):
+    """ERQuerySet.at in the middle of the fixture."""
+    date = EPOCH + datetime.timedelta(hours=size // 2)
+    return lambda: list(BenchmarkRange.objects.at(date))
+
+
+def fetch_instances(size):
+    """Fetching every item of the fixture as model instances."""
+    return lambda: list(BenchmarkRange.objects.all())
+
+
+def fetch_intervals(size):
+    """Fetching every item of the fixture with ERQuerySet.as_intervals."""
+    return lambda: list(BenchmarkRange.objects.all().as_intervals())
+
+
+def range_start_unix(size):
+    """DateRangeMixin.range_start_unix on 1000 fetched items."""
+    items = list(BenchmarkRange.objects.all()[:1000])
+
+    def operation():
+        for item in items:
+            item.range_start_unix()
+    return operation
+
+
+def date_normalise_shapes(size):
+    """date_normalise on each of its argument shapes."""
+    def operation():
+        for _, kwargs in date_normalise_benchmark.CASES:
+            date_normalise_benchmark.run_case(kwargs)
+    return operation
+date_normalise_shapes.name = 'date_normalise'
+
+
+BENCHMARKS = (
+    type_get_hit,
+    type_get_miss,
+    in_range,
+    at,
+    fetch_instances,
+    fetch_intervals,
+    range_start_unix,
+    date_normalise_shapes,
+)
+
+
+def measure(operation, repeat):
+    """Runs operation repeat times, returning the best wall time in
+    seconds and the number of queries made by one run.
+
+    """
+    best = None
+    queries = None
+    connection.use_debug_cursor = True
+    try:
+        for _ in xrange(repeat):
+            connection.queries = []
+            start = time.time()
+            operation()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+            queries = len(connection.queries)
+    finally:
+        connection.use_debug_cursor = None
+        connection.queries = []
+    return best, queries
+
+
+def run(sizes, repeat, only=None):
+    """Runs the benchmarks at each size, returning a list of results."""
+    create_tables()
+    results = []
+    for size in sorted(sizes):
+        populate(size)
+        for benchmark in BENCHMARKS:
+            name = getattr(benchmark, 'name', benchmark.__name__)
+            if only and name not in only:
+                continue
+            if name in SIZE_INDEPENDENT and size != min(sizes):
+                continue
+            seconds, queries = measure(benchmark(size), repeat)
+            results.append(dict(
+                name=name,
+                size=size,
+                seconds=seconds,
+                queries=queries
+            ))
+            print '{0:<18} {1:>8} {2:12.3f} ms {3:4} queries'.format(
+                name,
+                size,
+                seconds * 1e3,
+                queries
+            )
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints each result against the matching baseline result,
+    returning the number of regressions beyond threshold (a ratio).
+
+    """
+    old = dict(
+        ((result['name'], result['size']), result)
+        for result in baseline['results']
+    )
+    regressions = 0
+    for result in results:
+        before = old.get((result['name'], result['size']))
+        if before is None:
+            continue
+        ratio = result['seconds'] / max(before['seconds'], 1e-9)
+        flags = []
+        if ratio > threshold:
+            flags.append('SLOWER')
+        if result['queries'] > before['queries']:
+            flags.append('MORE QUERIES')
+        regressions += bool(flags)
+        print '{0:<18} {1:>8} {2:8.2f}x {3:4} -> {4:<4} {5}'.format(
+            result['name'],
+            result['size'],
+            ratio,
+            before['queries'],
+            result['queries'],
+            ' '.join(flags)
+        )
+    return regressions
+
+
+def main(argv=None):
+    """Entry point; see the module docstring."""
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option(
+        '--sizes',
+        default=','.join(str(size) for size in DEFAULT_SIZES),
+        help='comma-separated fixture sizes (rows per table)'
+    )
+    parser.add_option(
+        '--repeat',
+        type='int',
+        default=5,
+        help='runs per operation; the best time is kept'
+    )
+    parser.add_option(
+        '--only',
+        help='comma-separated names of benchmarks to run'
+    )
+    parser.add_option('--output', help='file to write results to')
+    parser.add_option('--baseline', help='results file to compare with')
+    parser.add_option(
+        '--threshold',
+        type='float',
+        default=1.2,
+        help='slowdown ratio counted as a regression'
+    )
+    options, _ = parser.parse_args(argv)
+
+    sizes = [int(float(size)) for size in options.sizes.split(',')]
+    only = options.only.split(',') if options.only else None
+    results = run(sizes, options.repeat, only)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(
+                dict(
+                    python=platform.python_version(),
+                    date=datetime.datetime.now().isoformat(),
+                    results=results
+                ),
+                output,
+                indent=2
+            )
+    if options.baseline:
+        with open(options.baseline) as baseline:
+            regressions = compare(
+                results,
+                json.load(baseline),
+                options.threshold
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
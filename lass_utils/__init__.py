@@ -21,6 +21,42 @@ It serves as the common root of the *LASS* inheritance hierarchy,
     :undoc-members:
     :show-inheritance:
 
+.. automodule:: lass_utils.aggregation
+    :members:
+    :show-inheritance:
+
+.. automodule:: lass_utils.generators
+    :members:
+    :show-inheritance:
+
+.. automodule:: lass_utils.invalidation
+    :members:
+    :show-inheritance:
+
+.. automodule:: lass_utils.pagination
+    :members:
+    :show-inheritance:
+
+.. automodule:: lass_utils.profiling
+    :members:
+    :show-inheritance:
+
+.. automodule:: lass_utils.recurrence
+    :members:
+    :show-inheritance:
+
+.. automodule:: lass_utils.routers
+    :members:
+    :show-inheritance:
+
+.. automodule:: lass_utils.snapshot
+    :members:
+    :show-inheritance:
+
+.. automodule:: lass_utils.time_utils
+    :members:
+    :show-inheritance:
+
 """
 
 __version__ = '1.0.0'
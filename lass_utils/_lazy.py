@@ -0,0 +1,64 @@
+"""
+Support for packages that import their public names lazily.
+
+A package calls :func:`lazy_module` at the end of its ``__init__``,
+listing the names it exports and the modules they live in.  Each name
+is then only imported the first time it is used, so importing the
+package (or one of its submodules) does not import everything the
+package exports.
+
+Python 2 modules cannot define ``__getattr__``, so the package's
+module is replaced in ``sys.modules`` by a :class:`LazyModule` that
+does.  Python 2's import machinery fetches a module back out of
+``sys.modules`` once it has run, so ``import`` and ``from ... import``
+both see the replacement.
+
+"""
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    A module whose listed attributes are imported from other modules
+    the first time they are looked up.
+
+    """
+
+    def __init__(self, module, attributes):
+        super(LazyModule, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        self.__dict__.setdefault('__all__', sorted(attributes))
+        # Python 2 clears the globals of a module when it is collected,
+        # which would break the functions defined in the original.
+        self._lazy_original = module
+        self._lazy_attributes = dict(attributes)
+
+    def __getattr__(self, name):
+        try:
+            module_name = self.__dict__['_lazy_attributes'][name]
+        except KeyError:
+            raise AttributeError(
+                "'module' object has no attribute '{0}'".format(name)
+            )
+        value = getattr(importlib.import_module(module_name), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._lazy_attributes))
+
+
+def lazy_module(name, attributes):
+    """
+    Makes the named (already imported) module import its attributes
+    lazily.
+
+    :param name: the name of the module, usually ``__name__``
+    :param attributes: a dictionary mapping each lazily imported name
+        onto the name of the module to import it from
+
+    """
+    sys.modules[name] = LazyModule(sys.modules[name], attributes)
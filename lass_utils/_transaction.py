@@ -0,0 +1,42 @@
+"""
+Support for helpers that write several statements as one unit.
+
+Django 1.4's ``transaction.commit_on_success`` commits whatever
+transaction is open when it exits, so nesting it inside a caller's
+transaction would commit the caller's earlier work too, even if the
+caller goes on to roll back.  :func:`commit_or_savepoint` only starts
+(and commits) a transaction of its own when none is being managed, and
+otherwise works inside a savepoint of the caller's.
+
+"""
+
+import contextlib
+
+from django.db import transaction
+
+
+@contextlib.contextmanager
+def commit_or_savepoint(using):
+    """
+    Context manager running its block as one unit on the given
+    database.
+
+    If the database is not under transaction management, the block
+    runs in a transaction of its own, committed if the block succeeds
+    and rolled back if not.  Otherwise, it runs in a savepoint that is
+    rolled back if the block raises, and the caller's transaction is
+    left for the caller to commit.
+
+    """
+    if not transaction.is_managed(using=using):
+        with transaction.commit_on_success(using=using):
+            yield
+        return
+
+    savepoint = transaction.savepoint(using=using)
+    try:
+        yield
+    except:
+        transaction.savepoint_rollback(savepoint, using=using)
+        raise
+    transaction.savepoint_commit(savepoint, using=using)
@@ -0,0 +1,193 @@
+"""
+Aggregation
+-----------
+
+This module contains functions for summarising
+:class:`lass_utils.mixins.EffectiveRangeMixin` querysets over time,
+such as "how many items were effective in each week of this year".
+
+Rather than querying once per bucket, or loading every item into
+memory, the rows overlapping the requested window are streamed from a
+single query and swept into per-bucket totals, at a cost linear in the
+number of rows plus the number of buckets.
+
+"""
+
+import bisect
+import datetime
+
+from lass_utils.time_utils import day_start
+from lass_utils.view_decorators import (
+    month_start,
+    next_month_start,
+    week_start
+)
+
+
+#: The bucket granularities understood by :func:`bucket_starts`.
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def bucket_starts(start, end, granularity):
+    """
+    Returns the starting dates of the buckets of the given granularity
+    that cover the dates from start (inclusive) to end (exclusive).
+
+    Weeks start on Mondays, as in ISO weeks; the first bucket may
+    start before start.
+
+    :param granularity: one of :data:`GRANULARITIES`
+    :raises ValueError: if the granularity is not recognised
+
+    """
+    if granularity == 'day':
+        date = start
+    elif granularity == 'week':
+        date = week_start(start)
+    elif granularity == 'month':
+        date = month_start(start)
+    else:
+        raise ValueError(
+            'Unknown granularity: {0}'.format(granularity)
+        )
+
+    starts = []
+    while date < end:
+        starts.append(date)
+        date = _next_bucket(date, granularity)
+    return starts
+
+
+def _next_bucket(date, granularity):
+    """
+    Returns the start of the bucket after the one starting on the given
+    date.
+
+    """
+    if granularity == 'day':
+        return date + datetime.timedelta(days=1)
+    if granularity == 'week':
+        return date + datetime.timedelta(weeks=1)
+    return next_month_start(date)
+
+
+def _seconds(delta):
+    """
+    Returns the number of seconds in a timedelta.
+
+    """
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def effective_totals(queryset,
+                     granularity,
+                     start,
+                     end,
+                     group_by=None,
+                     measure='count'):
+    """
+    Totals the items of an :class:`EffectiveRangeMixin` queryset that
+    are effective at any point in each bucket of a window.
+
+    Items with no ``effective_from``, and items whose ``effective_to``
+    is before their ``effective_from`` (which ``at`` and ``in_range``
+    never select), are ignored; items with no ``effective_to`` are
+    treated as effective forever.
+
+    :param queryset: the queryset (or manager) to aggregate
+    :param granularity: the size of the buckets; one of
+        :data:`GRANULARITIES`
+    :param start: the first date of the window
+    :param end: the date after the last date of the window
+    :param group_by: the name of a field to total separately for each
+        value of, or None
+    :param measure: ``'count'`` to count the items effective in each
+        bucket, or ``'duration'`` to sum how long items were
+        effective in each bucket (as a timedelta)
+    :returns: if group_by is None, a dictionary mapping the starting
+        date of each bucket to its total; otherwise, a dictionary
+        mapping each value of the group_by field to such a dictionary
+    :raises ValueError: if the granularity or measure is not
+        recognised
+
+    """
+    if measure not in ('count', 'duration'):
+        raise ValueError('Unknown measure: {0}'.format(measure))
+    starts = bucket_starts(start, end, granularity)
+    if not starts:
+        return {}
+    boundaries = [day_start(date) for date in starts]
+    boundaries.append(day_start(_next_bucket(starts[-1], granularity)))
+    buckets = len(starts)
+
+    fields = ['effective_from', 'effective_to']
+    if group_by is not None:
+        fields.append(group_by)
+    rows = (queryset
+            .filter(effective_from__lt=boundaries[-1])
+            .exclude(effective_to__lte=boundaries[0])
+            .values_list(*fields)
+            .iterator())
+
+    # For each group, 'full' is a difference array over the buckets.
+    # When counting, it counts the items overlapping each bucket; when
+    # summing durations, it counts the items covering each bucket
+    # entirely, and 'partial' holds the seconds of overlap of items
+    # only covering part of a bucket.
+    groups = {}
+    for row in rows:
+        effective_from, effective_to = row[0], row[1]
+        if effective_to is not None and effective_to < effective_from:
+            # Inverted ranges would unbalance the difference array.
+            continue
+        key = row[2] if group_by is not None else None
+        try:
+            full, partial = groups[key]
+        except KeyError:
+            full, partial = groups[key] = (
+                [0] * (buckets + 1),
+                [0.0] * buckets
+            )
+
+        first = max(bisect.bisect_right(boundaries, effective_from) - 1, 0)
+        if effective_to is None:
+            last = buckets - 1
+        else:
+            last = min(bisect.bisect_left(boundaries, effective_to) - 1,
+                       buckets - 1)
+
+        if measure == 'count':
+            full[first] += 1
+            full[last + 1] -= 1
+            continue
+
+        for index in set((first, last)):
+            overlap = _seconds(
+                min(effective_to or boundaries[index + 1],
+                    boundaries[index + 1])
+                - max(effective_from, boundaries[index])
+            )
+            partial[index] += overlap
+        if last - first > 1:
+            full[first + 1] += 1
+            full[last] -= 1
+
+    totals = {}
+    for key, (full, partial) in groups.iteritems():
+        bucket_totals = totals[key] = {}
+        covering = 0
+        for index, date in enumerate(starts):
+            covering += full[index]
+            if measure == 'count':
+                bucket_totals[date] = covering
+            else:
+                width = _seconds(boundaries[index + 1] - boundaries[index])
+                bucket_totals[date] = datetime.timedelta(
+                    seconds=covering * width + partial[index]
+                )
+
+    empty = datetime.timedelta() if measure == 'duration' else 0
+    if group_by is None:
+        return totals.get(None, dict((date, empty) for date in starts))
+    return totals
+
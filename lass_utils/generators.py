@@ -0,0 +1,247 @@
+"""
+Generators
+----------
+
+This module contains functions for filling the tables of models built
+on the ``lass_utils`` base classes and mixins with large, realistic,
+synthetic datasets, for benchmarking and tuning.
+
+Rows are generated lazily and inserted in batches, so memory use does
+not grow with the number of rows.  Given the same ``seed``, each
+generator produces the same dataset.
+
+"""
+
+import datetime
+import itertools
+import random
+
+from django.db import connections, router, transaction
+from django.db.models import AutoField
+
+
+#: Number of instances generated and inserted at a time.
+CHUNK_SIZE = 5000
+
+#: Date from which generated dates start by default.
+DEFAULT_START = datetime.datetime(2000, 1, 1)
+
+_WORDS = (
+    'music', 'news', 'sport', 'speech', 'drama', 'comedy', 'live',
+    'session', 'request', 'chart', 'classic', 'local', 'late', 'early',
+)
+
+
+def bulk_create_stream(model, instances, chunk_size=CHUNK_SIZE, raw=False):
+    """
+    Inserts every instance from an iterable into the model's table,
+    without ever holding more than ``chunk_size`` instances in memory.
+
+    Each chunk is inserted with ``bulk_create`` (so in as few queries
+    as the backend allows), and the whole stream is inserted in one
+    transaction.
+
+    :param model: the model to insert instances of
+    :param instances: an iterable (usually a generator) of unsaved
+        instances of the model
+    :param chunk_size: the number of instances taken from the iterable
+        at a time
+    :param raw: if True, fields' pre-save hooks (such as ``auto_now``
+        and ``auto_now_add``) are bypassed, so the values on the
+        instances are inserted as they are
+    :returns: the number of instances inserted
+
+    """
+    using = router.db_for_write(model)
+    instances = iter(instances)
+    count = 0
+    with transaction.commit_on_success(using=using):
+        while True:
+            chunk = list(itertools.islice(instances, chunk_size))
+            if not chunk:
+                break
+            if raw:
+                _raw_insert(model, chunk, using)
+            else:
+                model.objects.using(using).bulk_create(chunk)
+            count += len(chunk)
+    return count
+
+
+def _raw_insert(model, instances, using):
+    """
+    Inserts instances like ``bulk_create``, but without calling their
+    fields' pre-save hooks.
+
+    """
+    fields = [
+        field for field in model._meta.local_fields
+        if not isinstance(field, AutoField)
+    ]
+    ops = connections[using].ops
+    batch_size = max(ops.bulk_batch_size(fields, instances), 1)
+    for start in xrange(0, len(instances), batch_size):
+        model._base_manager._insert(
+            instances[start:start + batch_size],
+            fields=fields,
+            using=using,
+            raw=True
+        )
+
+
+def _extra_fields(extra, rng, index):
+    """
+    Returns the additional field values for the index-th instance.
+
+    """
+    return extra(rng, index) if extra else {}
+
+
+def generate_types(model,
+                   count,
+                   prefix='type',
+                   seed=None,
+                   extra=None,
+                   chunk_size=CHUNK_SIZE):
+    """
+    Fills the table of a :class:`lass_utils.models.Type` subclass with
+    ``count`` types named ``prefix0``, ``prefix1``, and so on.
+
+    :param extra: an optional function taking a ``random.Random`` and
+        the index of the instance being generated, and returning a
+        dictionary of any other field values it needs
+    :returns: the number of types inserted
+
+    """
+    rng = random.Random(seed)
+
+    def instances():
+        for index in xrange(count):
+            yield model(
+                name='{0}{1}'.format(prefix, index),
+                description=' '.join(rng.sample(_WORDS, 4)),
+                **_extra_fields(extra, rng, index)
+            )
+    return bulk_create_stream(model, instances(), chunk_size)
+
+
+def generate_effective_ranges(model,
+                              count,
+                              elements=None,
+                              element_field='element',
+                              start=DEFAULT_START,
+                              duration=datetime.timedelta(days=7),
+                              overlap_ratio=0.0,
+                              gap_ratio=0.0,
+                              open_ratio=0.0,
+                              seed=None,
+                              extra=None,
+                              chunk_size=CHUNK_SIZE):
+    """
+    Fills the table of an
+    :class:`lass_utils.mixins.EffectiveRangeMixin` model with
+    ``count`` ranges.
+
+    The ranges are split evenly between the given elements (or, if
+    there are none, form a single sequence), each element receiving a
+    sequence of ranges starting at ``start``.  Each range lasts
+    between half and one and a half times ``duration``, and normally
+    starts where the previous range of the same element ends.
+
+    :param elements: primary keys of the elements to attach ranges to
+        through ``element_field``, or None
+    :param overlap_ratio: the proportion of ranges that instead start
+        before the previous range ends
+    :param gap_ratio: the proportion of ranges that instead start some
+        time after the previous range ends
+    :param open_ratio: the proportion of elements whose last range has
+        no ``effective_to``
+    :param extra: an optional function taking a ``random.Random`` and
+        the index of the instance being generated, and returning a
+        dictionary of any other field values it needs
+    :returns: the number of ranges inserted
+
+    """
+    rng = random.Random(seed)
+    elements = list(elements) if elements else [None]
+    if elements != [None]:
+        element_field = model._meta.get_field(element_field).attname
+    per_element, remainder = divmod(count, len(elements))
+    seconds = duration.days * 86400 + duration.seconds
+
+    def random_duration(scale=1.0):
+        return datetime.timedelta(
+            seconds=int(seconds * scale * rng.uniform(0.5, 1.5))
+        )
+
+    def instances():
+        index = 0
+        for position, element in enumerate(elements):
+            length = per_element + (position < remainder)
+            end = start
+            for sequence in xrange(length):
+                choice = rng.random()
+                if sequence == 0:
+                    range_start = start
+                elif choice < overlap_ratio:
+                    range_start = end - random_duration(0.5)
+                elif choice < overlap_ratio + gap_ratio:
+                    range_start = end + random_duration()
+                else:
+                    range_start = end
+                end = range_start + random_duration()
+                is_open = (sequence == length - 1
+                           and rng.random() < open_ratio)
+
+                fields = _extra_fields(extra, rng, index)
+                if element is not None:
+                    fields[element_field] = element
+                yield model(
+                    effective_from=range_start,
+                    effective_to=None if is_open else end,
+                    **fields
+                )
+                index += 1
+    return bulk_create_stream(model, instances(), chunk_size)
+
+
+def generate_submittables(model,
+                          count,
+                          submitted_ratio=1.0,
+                          start=DEFAULT_START,
+                          spread=datetime.timedelta(days=365),
+                          seed=None,
+                          extra=None,
+                          chunk_size=CHUNK_SIZE):
+    """
+    Fills the table of a :class:`lass_utils.mixins.SubmittableMixin`
+    model with ``count`` items.
+
+    Submitted items have submission dates spread uniformly over
+    ``spread`` from ``start``.
+
+    :param submitted_ratio: the proportion of items that have been
+        submitted; the rest have no submission date
+    :param extra: an optional function taking a ``random.Random`` and
+        the index of the instance being generated, and returning a
+        dictionary of any other field values it needs
+    :returns: the number of items inserted
+
+    """
+    rng = random.Random(seed)
+    seconds = spread.days * 86400 + spread.seconds
+
+    def instances():
+        for index in xrange(count):
+            submitted = rng.random() < submitted_ratio
+            offset = rng.randint(0, seconds)
+            yield model(
+                date_submitted=(
+                    start + datetime.timedelta(seconds=offset)
+                    if submitted else None
+                ),
+                **_extra_fields(extra, rng, index)
+            )
+    # date_submitted is auto_now_add, which would otherwise overwrite
+    # the generated dates.
+    return bulk_create_stream(model, instances(), chunk_size, raw=True)
@@ -0,0 +1,312 @@
+"""
+Invalidation
+------------
+
+This module lets caches of :class:`lass_utils.mixins.EffectiveRangeMixin`
+data find out which periods of time a change affects, so that they
+only throw away what has actually gone stale.
+
+Caches are registered with :func:`register`.  Whenever an instance of
+an effective-range model is saved or deleted, the window of time it
+affects (the union of its old and new effective ranges) is worked out
+and passed to each cache registered for that model.
+
+:class:`PeriodCache` is a cache, backed by Django's cache framework,
+that stores values per day, week or month and, on invalidation, only
+drops the periods overlapping the affected window.
+
+Changes that bypass model signals (such as ``QuerySet.update``) can be
+announced with :func:`invalidate`.
+
+"""
+
+import datetime
+import uuid
+
+from django.core.cache import cache as default_cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from lass_utils.aggregation import _next_bucket, bucket_starts
+from lass_utils.mixins.effective_range import EffectiveRangeMixin
+from lass_utils.view_decorators import month_start, next_month_start
+
+
+# (cache, models) pairs, in registration order; models is None for
+# caches interested in every effective-range model.
+_caches = []
+
+
+def register(cache, models=None):
+    """
+    Registers a cache to be told about changes to effective-range
+    models.
+
+    :param cache: an object with an ``invalidate(model, start, end)``
+        method, where end is None for windows with no end
+    :param models: the models (including their subclasses) the cache
+        is interested in, or None for every effective-range model
+
+    """
+    _caches.append((cache, tuple(models) if models is not None else None))
+
+
+def unregister(cache):
+    """
+    Stops telling a cache about changes.
+
+    """
+    _caches[:] = [(other, models) for other, models in _caches
+                  if other is not cache]
+
+
+def affected_window(*ranges):
+    """
+    Returns the smallest window covering every given
+    ``(effective_from, effective_to)`` range, as a ``(start, end)``
+    pair where end is None if the window has no end.
+
+    Ranges with no ``effective_from`` are inert, and so ignored; if
+    every range is inert, None is returned.
+
+    """
+    ranges = [r for r in ranges if r is not None and r[0] is not None]
+    if not ranges:
+        return None
+    start = min(r[0] for r in ranges)
+    if any(r[1] is None for r in ranges):
+        return start, None
+    return start, max(r[1] for r in ranges)
+
+
+def invalidate(model, start, end):
+    """
+    Tells every cache registered for the given model that its data in
+    the window from start to end (or onwards, if end is None) has
+    changed.
+
+    """
+    for cache, models in _caches:
+        if models is None or issubclass(model, models):
+            cache.invalidate(model, start, end)
+
+
+def _interested(model):
+    """
+    Returns whether any registered cache wants to hear about changes
+    to the given model.
+
+    """
+    return issubclass(model, EffectiveRangeMixin) and any(
+        models is None or issubclass(model, models)
+        for _, models in _caches
+    )
+
+
+def _remember_old_range(sender, instance, raw=False, using=None, **kwargs):
+    """
+    pre_save handler that stores an instance's effective range as it
+    is in the database, before the save overwrites it.
+
+    """
+    if raw or instance.pk is None or not _interested(sender):
+        return
+    old = list(
+        sender._base_manager.using(using)
+        .filter(pk=instance.pk)
+        .values_list('effective_from', 'effective_to')
+    )
+    instance._old_effective_range = old[0] if old else None
+
+
+def _saved(sender, instance, raw=False, **kwargs):
+    """
+    post_save handler invalidating the window a save affected.
+
+    """
+    if raw or not _interested(sender):
+        return
+    window = affected_window(
+        getattr(instance, '_old_effective_range', None),
+        (instance.effective_from, instance.effective_to)
+    )
+    instance._old_effective_range = None
+    if window is not None:
+        invalidate(sender, *window)
+
+
+def _deleted(sender, instance, **kwargs):
+    """
+    post_delete handler invalidating the window a deletion affected.
+
+    """
+    if not _interested(sender):
+        return
+    window = affected_window(
+        (instance.effective_from, instance.effective_to)
+    )
+    if window is not None:
+        invalidate(sender, *window)
+
+
+pre_save.connect(_remember_old_range)
+post_save.connect(_saved)
+post_delete.connect(_deleted)
+
+
+def _local_date(value):
+    """
+    Returns the date of a datetime in the current time zone.
+
+    """
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+class PeriodCache(object):
+    """
+    A cache of values for periods (days, weeks or months) of time,
+    invalidated per period.
+
+    Each period has a version token, which forms part of the keys of
+    values cached for it; invalidating a period replaces its token, so
+    values cached under the old token are never seen again (and
+    expire in due course).  Tokens are random, so a token that expires
+    from the cache can never be reissued, and concurrent invalidations
+    cannot undo each other.
+
+    So that long (and open-ended) windows do not mean replacing a token
+    per period, periods are grouped into blocks (months of days, or
+    years of weeks or months) with a token of their own: blocks wholly
+    inside a window have their token replaced, and only the periods in
+    partly covered blocks are replaced one by one.
+
+    :param prefix: a prefix, unique to this cache, for its keys
+    :param granularity: the length of each period; one of
+        :data:`lass_utils.aggregation.GRANULARITIES`
+    :param horizon: how far past the later of now and the start of an
+        open-ended window to invalidate periods
+    :param timeout: the timeout for cached values, in seconds
+    :param cache: the Django cache to use; defaults to the default
+        cache
+
+    """
+
+    def __init__(self,
+                 prefix,
+                 granularity='day',
+                 horizon=datetime.timedelta(days=366),
+                 timeout=None,
+                 cache=None):
+        self.prefix = prefix
+        self.granularity = granularity
+        self.horizon = horizon
+        self.timeout = timeout
+        self.cache = cache or default_cache
+
+    def period(self, date):
+        """
+        Returns the start of the period containing a date or datetime.
+
+        """
+        if isinstance(date, datetime.datetime):
+            date = _local_date(date)
+        return bucket_starts(date, date + datetime.timedelta(days=1),
+                             self.granularity)[0]
+
+    def _block(self, period):
+        """
+        Returns the start of the block containing a period.
+
+        """
+        if self.granularity == 'day':
+            return month_start(period)
+        return datetime.date(period.year, 1, 1)
+
+    def _next_block(self, block):
+        """
+        Returns the start of the block after the given one.
+
+        """
+        if self.granularity == 'day':
+            return next_month_start(block)
+        return datetime.date(block.year + 1, 1, 1)
+
+    def _token_key(self, kind, date):
+        return '{0}:{1}:{2}'.format(self.prefix, kind, date.isoformat())
+
+    def key(self, date, name=''):
+        """
+        Returns the current cache key for the named value in the period
+        containing the given date.
+
+        """
+        period = self.period(date)
+        token_keys = (
+            self._token_key('period', period),
+            self._token_key('block', self._block(period))
+        )
+        tokens = self.cache.get_many(token_keys)
+        missing = [key for key in token_keys if key not in tokens]
+        if missing:
+            # add, rather than set, so that concurrent callers agree.
+            for key in missing:
+                self.cache.add(key, uuid.uuid4().hex)
+            tokens.update(self.cache.get_many(missing))
+        return '{0}:{1}:{2}:{3}:{4}'.format(
+            self.prefix,
+            period.isoformat(),
+            tokens.get(token_keys[0]),
+            tokens.get(token_keys[1]),
+            name
+        )
+
+    def get(self, date, name='', default=None):
+        """
+        Returns the named value cached for the period containing the
+        given date.
+
+        """
+        return self.cache.get(self.key(date, name), default)
+
+    def set(self, date, value, name=''):
+        """
+        Caches the named value for the period containing the given date.
+
+        """
+        self.cache.set(self.key(date, name), value, self.timeout)
+
+    def invalidate(self, model, start, end):
+        """
+        Invalidates every period overlapping the window from start to
+        end.  If end is None, periods up to the horizon are
+        invalidated.
+
+        """
+        if end is None:
+            now = timezone.now()
+            if timezone.is_naive(start) and timezone.is_aware(now):
+                now = timezone.make_naive(now, timezone.utc)
+            end = max(start, now) + self.horizon
+        first = self.period(start)
+        last = self.period(end)
+        after_last = _next_bucket(last, self.granularity)
+
+        tokens = {}
+        block = self._block(first)
+        while block <= last:
+            next_block = self._next_block(block)
+            if first <= block and next_block <= after_last:
+                tokens[self._token_key('block', block)] = uuid.uuid4().hex
+            else:
+                for period in bucket_starts(
+                    max(first, block),
+                    min(after_last, next_block),
+                    self.granularity
+                ):
+                    if block <= period and first <= period <= last:
+                        key = self._token_key('period', period)
+                        tokens[key] = uuid.uuid4().hex
+            block = next_block
+        self.cache.set_many(tokens)
@@ -0,0 +1,316 @@
+"""
+Checks the table of an :class:`lass_utils.mixins.EffectiveRangeMixin`
+model for ranges that would make ``at`` return more than one item per
+element, or none at all.
+
+For each element (the value of the ``--key`` field), the command
+reports:
+
+* ``overlap``: two ranges effective at the same time;
+* ``inverted``: a range whose ``effective_to`` is before its
+  ``effective_from``;
+* ``inert``: a range with no ``effective_from`` but an
+  ``effective_to``, which is almost certainly a mistake (with
+  ``--no-inert``, every range with no ``effective_from``).
+
+Rows are read in chunks, in key order, and the checking of each batch
+of elements is spread over a pool of worker processes.  The report is
+written as JSON.
+
+"""
+
+import collections
+import itertools
+import json
+import multiprocessing
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q, get_model
+
+from lass_utils.mixins import EffectiveRangeMixin
+
+
+#: The number of rows read from the database at a time.
+CHUNK_SIZE = 10000
+
+
+def check_partition(groups):
+    """
+    Checks a batch of elements' ranges.
+
+    :param groups: a list of (key, rows) pairs, where rows is a list of
+        (pk, effective_from, effective_to) tuples for that key in
+        effective_from order
+    :returns: a list of problems, each a dictionary with ``type``,
+        ``key`` and ``pks`` items
+
+    """
+    problems = []
+    for key, rows in groups:
+        # The range reaching furthest into the future so far, which
+        # any later range starting before its end overlaps.
+        latest = None
+        for pk, effective_from, effective_to in rows:
+            if effective_to is not None and effective_to < effective_from:
+                problems.append(dict(type='inverted', key=key, pks=[pk]))
+                continue
+            if latest is not None:
+                latest_pk, latest_to = latest
+                if latest_to is None or effective_from < latest_to:
+                    problems.append(
+                        dict(type='overlap', key=key, pks=[latest_pk, pk])
+                    )
+            if (latest is None
+                    or latest[1] is not None
+                    and (effective_to is None or effective_to > latest[1])):
+                latest = (pk, effective_to)
+    return problems
+
+
+def _keyset_chunks(queryset, key, chunk_size):
+    """
+    Yields the (key, pk, effective_from, effective_to) rows of a
+    queryset of non-inert ranges in key, effective_from and pk order,
+    reading chunk_size rows at a time.
+
+    Each chunk carries on from the last row of the one before, so no
+    chunk needs an offset and each is as quick to fetch as the first.
+
+    """
+    opts = queryset.model._meta
+    queryset = queryset.values_list(
+        key,
+        'pk',
+        'effective_from',
+        'effective_to'
+    ).extra(order_by=[
+        '{0}.{1}'.format(opts.db_table, opts.get_field(key).column),
+        'effective_from',
+        'pk'
+    ])
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            last_key, last_pk, last_from = last[:3]
+            chunk = chunk.filter(
+                Q(**{key + '__gt': last_key})
+                | Q(**{key: last_key, 'effective_from__gt': last_from})
+                | Q(**{
+                    key: last_key,
+                    'effective_from': last_from,
+                    'pk__gt': last_pk
+                })
+            )
+        rows = list(chunk[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            break
+        last = rows[-1]
+
+
+def _pk_chunks(queryset, chunk_size):
+    """
+    Yields the (pk, key, effective_to) rows of a queryset in pk order,
+    reading chunk_size rows at a time.
+
+    """
+    last = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        rows = list(chunk[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            break
+        last = rows[-1][0]
+
+
+def _partitions(rows, partition_size):
+    """
+    Groups key-ordered rows by key, yielding lists of (key, rows)
+    pairs holding around partition_size rows each.
+
+    """
+    partition = []
+    size = 0
+    for key, group in itertools.groupby(rows, lambda row: row[0]):
+        group = [row[1:] for row in group]
+        partition.append((key, group))
+        size += len(group)
+        if size >= partition_size:
+            yield partition
+            partition = []
+            size = 0
+    if partition:
+        yield partition
+
+
+def check_model(model,
+                key,
+                workers=None,
+                chunk_size=CHUNK_SIZE,
+                no_inert=False,
+                using=None):
+    """
+    Checks every range in a model's table, returning a report
+    dictionary.
+
+    :param model: the :class:`EffectiveRangeMixin` model to check
+    :param key: the name of the field identifying the element each
+        range belongs to
+    :param workers: the number of worker processes to check in; if 1,
+        everything is checked in this process
+    :param chunk_size: the number of rows read, and checked by a worker,
+        at a time
+    :param no_inert: if True, every range with no ``effective_from`` is
+        reported, not just those with an ``effective_to``
+    :param using: the database to check, if not the default
+
+    """
+    queryset = model._default_manager.all()
+    if using is not None:
+        queryset = queryset.using(using)
+    # exclude, rather than __isnull, avoids joining a foreign key's
+    # table.
+    ranges = queryset.filter(effective_from__isnull=False).exclude(
+        **{key: None}
+    )
+
+    counts = collections.defaultdict(int)
+    problems = []
+    state = dict(rows=0, elements=0)
+
+    def partitions():
+        rows = _keyset_chunks(ranges, key, chunk_size)
+        for partition in _partitions(rows, chunk_size):
+            state['rows'] += sum(len(group) for _, group in partition)
+            state['elements'] += len(partition)
+            yield partition
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers == 1:
+        results = itertools.imap(check_partition, partitions())
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = _bounded_imap(pool, check_partition, partitions(),
+                                workers * 2)
+    try:
+        for result in results:
+            problems.extend(result)
+    finally:
+        if workers != 1:
+            pool.close()
+            pool.join()
+
+    inert = queryset.filter(effective_from__isnull=True)
+    if not no_inert:
+        inert = inert.filter(effective_to__isnull=False)
+    for pk, key_value, _ in _pk_chunks(
+        inert.values_list('pk', key, 'effective_to'),
+        chunk_size
+    ):
+        problems.append(dict(type='inert', key=key_value, pks=[pk]))
+
+    for problem in problems:
+        counts[problem['type']] += 1
+    return dict(
+        model='{0}.{1}'.format(model._meta.app_label,
+                               model._meta.object_name),
+        key=key,
+        rows=state['rows'],
+        elements=state['elements'],
+        counts=dict(counts),
+        problems=problems
+    )
+
+
+def _bounded_imap(pool, function, iterable, limit):
+    """
+    Like ``pool.imap``, but never reads more than limit items ahead of
+    the results, so the rows waiting to be checked are never all held
+    in memory at once.
+
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(function, (item,)))
+        if len(pending) >= limit:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName>'
+    help = ('Checks an effective-range model for overlapping, inverted '
+            'and inert ranges, writing a JSON report.')
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--key',
+            default='element',
+            help='The field identifying the element each range belongs '
+                 'to (default: element).'
+        ),
+        make_option(
+            '--workers',
+            type='int',
+            default=None,
+            help='The number of worker processes (default: one per CPU).'
+        ),
+        make_option(
+            '--chunk-size',
+            dest='chunk_size',
+            type='int',
+            default=CHUNK_SIZE,
+            help='The number of rows read at a time.'
+        ),
+        make_option(
+            '--no-inert',
+            dest='no_inert',
+            action='store_true',
+            default=False,
+            help='Report every range with no effective_from.'
+        ),
+        make_option(
+            '--output',
+            default=None,
+            help='The file to write the report to (default: stdout).'
+        ),
+        make_option(
+            '--database',
+            default=None,
+            help='The database to check.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1 or '.' not in args[0]:
+            raise CommandError('Give one model, as app_label.ModelName.')
+        model = get_model(*args[0].split('.', 1))
+        if model is None:
+            raise CommandError('Unknown model: {0}'.format(args[0]))
+        if not issubclass(model, EffectiveRangeMixin):
+            raise CommandError(
+                '{0} is not an effective-range model.'.format(args[0])
+            )
+
+        report = check_model(
+            model,
+            options['key'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            no_inert=options['no_inert'],
+            using=options['database']
+        )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2) + '\n')
@@ -29,14 +29,14 @@ from `django.models.Model`.
     :show-inheritance:
 
 """
-from lass_utils.mixins.attachable import AttachableMixin
-AttachableMixin = AttachableMixin
-
-from lass_utils.mixins.submittable import SubmittableMixin
-SubmittableMixin = SubmittableMixin
-
-from lass_utils.mixins.date_range import DateRangeMixin
-DateRangeMixin = DateRangeMixin
-
-from lass_utils.mixins.effective_range import EffectiveRangeMixin
-EffectiveRangeMixin = EffectiveRangeMixin
+from lass_utils._lazy import lazy_module
+
+# Each mixin (and with it django.db.models and model_utils) is only
+# imported when first used, so that importing one mixin's module, or
+# a module such as lass_utils.view_decorators, stays cheap.
+lazy_module(__name__, {
+    'AttachableMixin': 'lass_utils.mixins.attachable',
+    'SubmittableMixin': 'lass_utils.mixins.submittable',
+    'DateRangeMixin': 'lass_utils.mixins.date_range',
+    'EffectiveRangeMixin': 'lass_utils.mixins.effective_range',
+})
@@ -5,7 +5,45 @@ to one form.
 
 """
 
+import threading
+
+from django.conf import settings
 from django.db import models
+from django.db.models.loading import AppCache
+
+from lass_utils import routers
+from lass_utils.mixins.effective_range import EffectiveRangeMixin
+from lass_utils.profiling import count_rows, profiled
+
+
+# Attachable models made by AttachableMixin.make_model, keyed on
+# (attachable class, target name, app, table).  Models made lazily are
+# LazyModel instances until they are constructed.
+_registry = {}
+
+# Keys into _registry, grouped by target name, in the order in which
+# the models were made.
+_registry_by_target = {}
+
+# LazyModels that have not been constructed yet.
+_pending = []
+
+_registry_lock = threading.RLock()
+
+
+def _target_name(target_class):
+    """
+    Returns the name of a target given either a model class or the
+    name of one.
+
+    """
+    if isinstance(target_class, basestring):
+        # We got a string in, which is hopefully a model name.
+        # This means the target name and the target are equal.
+        return target_class
+    # We got something that we hope is a class object in.
+    # Its name is just the __name__ param.
+    return target_class.__name__
 
 
 class AttachableMixin(object):
@@ -31,7 +69,8 @@ class AttachableMixin(object):
                    model_name=None,
                    table=None,
                    id_column=None,
-                   fkey=None):
+                   fkey=None,
+                   lazy=None):
         """
         Constructs a concrete implementation of this attachable model
         to provide data to a provided model.
@@ -41,16 +80,59 @@ class AttachableMixin(object):
         can be instantiated in a stand-alone context by leaving ``fkey``
         as ``None``.
 
+        The model is only constructed once for each combination of
+        this class, target, ``app`` and ``table``; subsequent calls
+        return the existing model.
+
+        If ``lazy`` is True (or is None and the ``LASS_LAZY_ATTACHABLES``
+        setting is True), a :class:`LazyModel` is returned instead,
+        and the model itself is only constructed when first used or
+        when Django finishes loading its installed apps, whichever
+        happens first.
+
         """
-        if isinstance(target_class, basestring):
-            # We got a string in, which is hopefully a model name.
-            # This means the target name and the target are equal.
-            target_name = target_class
-        else:
-            # We got something that we hope is a class object in.
-            # Its name is just the __name__ param.
-            target_name = target_class.__name__
+        if lazy is None:
+            lazy = getattr(settings, 'LASS_LAZY_ATTACHABLES', False)
+        target_name = _target_name(target_class)
+
+        # Attachables are only ever built once per target, app and
+        # table; later calls get the model built by the first.
+        key = (cls, target_name, app, table)
+        with _registry_lock:
+            try:
+                model = _registry[key]
+            except KeyError:
+                model = LazyModel(
+                    key,
+                    cls._build_model,
+                    target_name,
+                    app,
+                    model_name,
+                    table,
+                    id_column,
+                    fkey
+                )
+                _registry[key] = model
+                _registry_by_target.setdefault(target_name, []).append(key)
+                if lazy:
+                    # Only models left unbuilt need the app cache to
+                    # build them once it has loaded.
+                    _pending.append(model)
+                    _install_app_cache_hook()
+        return model if lazy else resolve_model(model)
 
+    @classmethod
+    def _build_model(cls,
+                     target_name,
+                     app,
+                     model_name,
+                     table,
+                     id_column,
+                     fkey):
+        """
+        Constructs the model for :meth:`make_model`.
+
+        """
         # The 'fields' dict will contain the fields that we're
         # adding on top of cls for the metadata class we're building.
         fields = {'__module__': __name__}
@@ -92,3 +174,181 @@ class AttachableMixin(object):
             (cls,),
             fields
         )
+
+    @classmethod
+    def attachables_for(cls, target_class):
+        """
+        Lists the concrete attachable models that have been made, via
+        :meth:`make_model`, for the given target.
+
+        If called on a subclass, only attachables made from that
+        subclass are listed.  Lazily made attachables are constructed.
+
+        :param target_class: the target model, or its name
+        :rtype: list of model classes
+
+        """
+        return [
+            resolve_model(_registry[key]) for key
+            in _registry_by_target.get(_target_name(target_class), ())
+            if issubclass(key[0], cls)
+        ]
+
+
+class LazyModel(object):
+    """
+    A stand-in for an attachable model that has not been constructed
+    yet, as returned by :meth:`AttachableMixin.make_model` in lazy
+    mode.
+
+    Attribute access and calls are forwarded to the model, which is
+    constructed on first use.  The model itself is available as
+    :attr:`model`; use that where a real class is needed, such as in
+    ``isinstance`` checks or as a foreign key target.
+
+    """
+
+    def __init__(self, key, build, *args):
+        self._key = key
+        self._build = build
+        self._args = args
+        self._model = None
+
+    @property
+    def model(self):
+        """
+        The model this stands in for, which is constructed if need be.
+
+        """
+        if self._model is None:
+            with _registry_lock:
+                if self._model is None:
+                    self._model = self._build(*self._args)
+                    _registry[self._key] = self._model
+                    if self in _pending:
+                        _pending.remove(self)
+        return self._model
+
+    def is_built(self):
+        """
+        Returns whether the model has been constructed yet.
+
+        """
+        return self._model is not None
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __call__(self, *args, **kwargs):
+        return self.model(*args, **kwargs)
+
+    def __repr__(self):
+        return '<LazyModel for {0}>'.format(
+            self._model if self.is_built() else self._key
+        )
+
+
+def resolve_model(model):
+    """
+    Returns the model behind a :class:`LazyModel`, constructing it if
+    need be; any other model is returned as is.
+
+    """
+    return model.model if isinstance(model, LazyModel) else model
+
+
+def build_pending_models():
+    """
+    Constructs every lazily made attachable model that has not yet
+    been constructed.
+
+    This happens automatically once Django has loaded all of its
+    installed apps.
+
+    """
+    while _pending:
+        _pending[0].model
+
+
+def _install_app_cache_hook():
+    """
+    Arranges for :func:`build_pending_models` to run whenever Django's
+    app cache finishes loading, so that lazily made models are known
+    to syncdb, migrations and any other code that enumerates models.
+
+    Django 1.4 has no signal for this, so the app cache's populate
+    method is wrapped (once).
+
+    """
+    if getattr(AppCache._populate, 'builds_lazy_models', False):
+        return
+    populate = AppCache._populate
+
+    def _populate(self):
+        populate(self)
+        if self.loaded and _pending:
+            build_pending_models()
+    _populate.builds_lazy_models = True
+    AppCache._populate = _populate
+
+
+@profiled('prefetch_attachables')
+def prefetch_attachables(targets, attachables, at=None, replica=False):
+    """
+    Fetches the attachable data for a collection of targets in bulk.
+
+    Each attachable model is fetched with a single ``element__in``
+    query, rather than one query per target.  The results are stored
+    on each target in a dictionary, ``prefetched_attachables``, that
+    maps each attachable model to the list of its instances attached
+    to that target (in the attachable's default ordering).  Each of
+    those instances has its ``element`` pre-populated with the target.
+
+    :param targets: the target model instances
+    :param attachables: the concrete attachable models to fetch, as
+        made by :meth:`AttachableMixin.make_model` (any
+        :class:`LazyModel` is resolved to its model, which is what the
+        results are keyed on); they must have an
+        ``element`` foreign key to the targets' model
+    :param at: if given, attachables that are also
+        :class:`EffectiveRangeMixin` models are restricted to those
+        effective at this datetime
+    :param replica: if True, the attachables are read from a replica
+        (see :func:`lass_utils.routers.on_replica`)
+    :returns: the targets, as a list
+
+    """
+    targets = list(targets)
+    targets_by_pk = {}
+    fetched = 0
+    for target in targets:
+        if not hasattr(target, 'prefetched_attachables'):
+            target.prefetched_attachables = {}
+        targets_by_pk.setdefault(target.pk, []).append(target)
+
+    for attachable in attachables:
+        attachable = resolve_model(attachable)
+        for target in targets:
+            target.prefetched_attachables[attachable] = []
+        if not targets_by_pk:
+            continue
+
+        element = attachable._meta.get_field('element')
+        queryset = attachable.objects.filter(
+            element__in=list(targets_by_pk)
+        )
+        if at is not None and issubclass(attachable, EffectiveRangeMixin):
+            queryset = queryset.at(at)
+        if replica:
+            queryset = routers.on_replica(queryset)
+
+        for item in queryset:
+            fetched += 1
+            element_targets = targets_by_pk[getattr(item, element.attname)]
+            # Save the item a query if it is asked for its element.
+            setattr(item, element.get_cache_name(), element_targets[0])
+            for target in element_targets:
+                target.prefetched_attachables[attachable].append(item)
+    # The targets are returned, so their number is not the rows fetched.
+    count_rows(fetched)
+    return targets
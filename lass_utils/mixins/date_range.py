@@ -3,7 +3,7 @@ range.
 
 """
 
-import calendar
+from lass_utils.time_utils import to_unix
 
 
 class DateRangeMixin(object):
@@ -11,6 +11,10 @@ class DateRangeMixin(object):
     datetime range.
 
     """
+    # Lets slotted classes, such as the intervals of
+    # lass_utils.mixins.effective_range, use this mixin without
+    # gaining a __dict__.
+    __slots__ = ()
 
     ## MANDATORY OVERRIDES ##
 
@@ -65,11 +69,11 @@ class DateRangeMixin(object):
         Returns the start of the range as a UNIX timestamp from UTC.
 
         """
-        return calendar.timegm(self.range_start().utctimetuple())
+        return to_unix(self.range_start())
 
     def range_end_unix(self):
         """
         Returns the end of the range as a UNIX timestamp from UTC.
 
         """
-        return calendar.timegm(self.range_end().utctimetuple())
+        return to_unix(self.range_end())
@@ -4,13 +4,69 @@ to' pair of fields.
 
 """
 
-from django.db import models
+import collections
+import heapq
+import itertools
+import operator
+import sys
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
 from django.db.models.query import QuerySet
 from django.utils import timezone
 
 from model_utils.managers import PassThroughManager
 
+from lass_utils import profiling, routers
+from lass_utils._transaction import commit_or_savepoint
 from lass_utils.mixins.date_range import DateRangeMixin
+from lass_utils.view_decorators import request_memoise
+
+
+class Interval(DateRangeMixin):
+    """
+    Base for the lightweight interval objects returned by
+    :meth:`ERQuerySet.as_intervals`.
+
+    Intervals are tuples (see :func:`interval_class`), so they take
+    little more memory than the rows they come from, but still offer
+    the :class:`DateRangeMixin` interface.
+
+    """
+    __slots__ = ()
+
+    def range_start(self):
+        return self.effective_from
+
+    def range_end(self):
+        return self.effective_to
+
+
+# Maps tuples of extra field names onto interval classes.
+_interval_classes = {}
+
+
+def interval_class(fields=()):
+    """
+    Returns the :class:`Interval` class holding ``pk``,
+    ``effective_from``, ``effective_to`` and the given extra fields,
+    in that order.
+
+    Classes are named tuples, and are created once per tuple of field
+    names.
+
+    """
+    fields = tuple(fields)
+    try:
+        return _interval_classes[fields]
+    except KeyError:
+        pass
+    row = collections.namedtuple(
+        'IntervalRow',
+        ('pk', 'effective_from', 'effective_to') + fields
+    )
+    interval = type('Interval', (row, Interval), {'__slots__': ()})
+    return _interval_classes.setdefault(fields, interval)
 
 
 class ERQuerySet(QuerySet):
@@ -38,9 +94,11 @@ class ERQuerySet(QuerySet):
 
         # Note that filter throws out objects with fields set to
         # NULL whereas exclude does not.
-        return (self
-                .filter(effective_from__lte=from_date)
-                .exclude(effective_to__lt=to_date))
+        queryset = (self
+                    .filter(effective_from__lte=from_date)
+                    .exclude(effective_to__lt=to_date))
+        queryset._profiled_helper = 'ERQuerySet.in_range'
+        return queryset
 
     def at(self, date):
         """
@@ -48,7 +106,57 @@ class ERQuerySet(QuerySet):
         at the given moment in time.
 
         """
-        return self.in_range(date, date)
+        queryset = self.in_range(date, date)
+        queryset._profiled_helper = 'ERQuerySet.at'
+        return queryset
+
+    def as_intervals(self, *fields):
+        """
+        Iterates over the items in this QuerySet as
+        :class:`Interval` objects holding only ``pk``,
+        ``effective_from``, ``effective_to`` and the given fields,
+        rather than as model instances.
+
+        The intervals are built straight from ``values_list`` rows, so
+        are much cheaper to create and hold than model instances.
+
+        """
+        make = tuple.__new__
+        interval = interval_class(fields)
+        rows = self.values_list(
+            'pk',
+            'effective_from',
+            'effective_to',
+            *fields
+        )
+        for row in rows.iterator():
+            yield make(interval, row)
+
+    def _clone(self, *args, **kwargs):
+        """
+        Copies this QuerySet, along with the name of the helper that
+        created it, so that QuerySets chained from a helper's result
+        are still recorded against the helper.
+
+        """
+        clone = super(ERQuerySet, self)._clone(*args, **kwargs)
+        helper = getattr(self, '_profiled_helper', None)
+        if helper is not None:
+            clone._profiled_helper = helper
+        return clone
+
+    def iterator(self):
+        """
+        Iterates over the results of this QuerySet, recording them
+        against the helper that created it if profiling is on (see
+        :mod:`lass_utils.profiling`).
+
+        """
+        iterator = super(ERQuerySet, self).iterator()
+        helper = getattr(self, '_profiled_helper', None)
+        if helper is not None and profiling.enabled:
+            iterator = profiling.profile_iterator(helper, iterator)
+        return iterator
 
 
 class EffectiveRangeMixin(models.Model, DateRangeMixin):
@@ -87,17 +195,58 @@ class EffectiveRangeMixin(models.Model, DateRangeMixin):
         return self.effective_to
 
     @classmethod
-    def in_range(cls, from_date, to_date, queryset=None):
-        """Compatibility wrapper for QuerySet.in_range."""
+    def in_range(cls, from_date, to_date, queryset=None, replica=False):
+        """Compatibility wrapper for QuerySet.in_range.
+
+        If replica is True, the QuerySet reads from a replica (see
+        :func:`lass_utils.routers.on_replica`).
+
+        """
         if queryset is None:
-            queryset = cls.objects
+            queryset = cls.objects.all()
+        if replica:
+            queryset = routers.on_replica(queryset)
         return queryset.in_range(from_date, to_date)
 
     @classmethod
-    def at(cls, date, queryset=None):
-        """Compatibility wrapper for QuerySet.at."""
+    def at(cls, date, queryset=None, replica=False):
+        """Compatibility wrapper for QuerySet.at.
+
+        If no queryset is given and a request cache is active, the
+        resulting QuerySet is shared for the rest of the request, so
+        it is only evaluated against the database once.
+
+        If replica is True, the QuerySet reads from a replica (see
+        :func:`lass_utils.routers.on_replica`).
+
+        If no queryset is given and an :class:`AsOf` context for this
+        date is active, the context's QuerySet is returned instead (and
+        replica is ignored).
+
+        """
         if queryset is None:
-            queryset = cls.objects
+            context = active_as_of(date)
+            if context is not None:
+                return context.at(cls)
+            return request_memoise(
+                ('effective-range-at', cls, date, replica),
+                cls._at_uncached,
+                date,
+                replica
+            )
+        if replica:
+            queryset = routers.on_replica(queryset)
+        return queryset.at(date)
+
+    @classmethod
+    def _at_uncached(cls, date, replica):
+        """
+        Builds the QuerySet for :meth:`at` with no queryset given.
+
+        """
+        queryset = cls.objects.all()
+        if replica:
+            queryset = routers.on_replica(queryset)
         return queryset.at(date)
 
     objects = PassThroughManager.for_queryset_class(ERQuerySet)()
@@ -105,3 +254,349 @@ class EffectiveRangeMixin(models.Model, DateRangeMixin):
     class Meta(object):
         get_latest_by = 'effective_from'
         abstract = True
+
+
+## TEMPORAL JOINS ##
+
+# Rows fetched from the database at a time by temporal joins.  Each
+# chunk's ids are bound as parameters of an in_bulk query, so this
+# stays under SQLite's default limit of 999 parameters a query.
+JOIN_CHUNK_SIZE = 500
+
+
+def _overlaps(left, right):
+    """
+    Returns whether two items are effective at the same time: that is,
+    whether each starts strictly before the other ends.
+
+    """
+    return (
+        (right.effective_to is None
+         or left.effective_from < right.effective_to)
+        and (left.effective_to is None
+             or right.effective_from < left.effective_to)
+    )
+
+
+def _window(left, right):
+    """
+    Returns the window in which two overlapping items are both
+    effective, as a (start, end) pair where end is None if the window
+    has no end.
+
+    """
+    ends = [
+        end for end in (left.effective_to, right.effective_to)
+        if end is not None
+    ]
+    return (
+        max(left.effective_from, right.effective_from),
+        min(ends) if ends else None
+    )
+
+
+def _join_columns(queryset, key):
+    """
+    Returns the primary key and join key columns of a queryset's
+    model.
+
+    """
+    opts = queryset.model._meta
+    return opts.pk.column, opts.get_field(key).column
+
+
+def _sql_join(left, right, key, right_key):
+    """
+    Yields the (left pk, right pk) pairs of a temporal join, using a
+    single SQL query joining both querysets as subqueries.
+
+    """
+    connection = connections[left.db]
+    qn = connection.ops.quote_name
+    left_pk, left_column = _join_columns(left, key)
+    right_pk, right_column = _join_columns(right, right_key)
+
+    left_sql, left_params = (left.order_by()
+                             .values_list('pk', key, 'effective_from',
+                                          'effective_to')
+                             .query.sql_with_params())
+    right_sql, right_params = (right.order_by()
+                               .values_list('pk', right_key,
+                                            'effective_from',
+                                            'effective_to')
+                               .query.sql_with_params())
+    sql = (
+        'SELECT l.{left_pk}, r.{right_pk} '
+        'FROM ({left_sql}) l INNER JOIN ({right_sql}) r '
+        'ON l.{left_column} = r.{right_column} '
+        'AND (r.{to} IS NULL OR l.{from_} < r.{to}) '
+        'AND (l.{to} IS NULL OR r.{from_} < l.{to}) '
+        'ORDER BY l.{from_}, l.{left_pk}, r.{from_}, r.{right_pk}'
+    ).format(
+        left_pk=qn(left_pk),
+        right_pk=qn(right_pk),
+        left_sql=left_sql,
+        right_sql=right_sql,
+        left_column=qn(left_column),
+        right_column=qn(right_column),
+        from_=qn('effective_from'),
+        to=qn('effective_to')
+    )
+    cursor = connection.cursor()
+    cursor.execute(sql, tuple(left_params) + tuple(right_params))
+    while True:
+        rows = cursor.fetchmany(JOIN_CHUNK_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+
+def _sql_join_items(left, right, key, right_key):
+    """
+    Yields the (left, right) item pairs of a temporal join done in
+    SQL, fetching the items themselves a chunk at a time.
+
+    """
+    pairs = iter(_sql_join(left, right, key, right_key))
+    while True:
+        chunk = list(itertools.islice(pairs, JOIN_CHUNK_SIZE))
+        if not chunk:
+            break
+        left_items = left.model._base_manager.using(left.db).in_bulk(
+            set(pair[0] for pair in chunk)
+        )
+        right_items = right.model._base_manager.using(right.db).in_bulk(
+            set(pair[1] for pair in chunk)
+        )
+        for left_pk, right_pk in chunk:
+            yield left_items[left_pk], right_items[right_pk]
+
+
+def _sorted_for_merge(queryset, key):
+    """
+    Returns a queryset ordered by the join key column and then by
+    effective_from.
+
+    The column is used directly so that foreign keys are not ordered
+    by their target's default ordering.
+
+    """
+    opts = queryset.model._meta
+    return queryset.extra(order_by=[
+        '{0}.{1}'.format(opts.db_table, opts.get_field(key).column),
+        'effective_from',
+        'pk'
+    ])
+
+
+def _merge_join_items(left, right, key, right_key):
+    """
+    Yields the (left, right) item pairs of a temporal join, streaming
+    both querysets in key and then effective_from order.
+
+    Keys are compared in Python, so must sort the same way there as in
+    both databases (as integers, including foreign keys, do).
+
+    """
+    left_attname = left.model._meta.get_field(key).attname
+    right_attname = right.model._meta.get_field(right_key).attname
+    left_groups = itertools.groupby(
+        _sorted_for_merge(left, key).iterator(),
+        operator.attrgetter(left_attname)
+    )
+    right_groups = itertools.groupby(
+        _sorted_for_merge(right, right_key).iterator(),
+        operator.attrgetter(right_attname)
+    )
+    left_group = next(left_groups, None)
+    right_group = next(right_groups, None)
+    while left_group is not None and right_group is not None:
+        left_value, left_items = left_group
+        right_value, right_items = right_group
+        if left_value is None or left_value < right_value:
+            left_group = next(left_groups, None)
+        elif right_value is None or right_value < left_value:
+            right_group = next(right_groups, None)
+        else:
+            for pair in _sweep(left_items, right_items):
+                yield pair
+            left_group = next(left_groups, None)
+            right_group = next(right_groups, None)
+
+
+def _sweep(left_items, right_items):
+    """
+    Yields the overlapping (left, right) pairs from two iterables of
+    items with the same join key, each in effective_from order.
+
+    Each item, as it starts, is paired with the items of the other side
+    that started before it and are still effective.
+
+    """
+    # The index keeps items themselves from ever being compared.
+    index = itertools.count()
+    starts = heapq.merge(
+        ((item.effective_from, 0, next(index), item)
+         for item in left_items),
+        ((item.effective_from, 1, next(index), item)
+         for item in right_items)
+    )
+    active = ([], [])
+    for start, side, _, item in starts:
+        other = active[1 - side]
+        other[:] = [
+            candidate for candidate in other
+            if candidate.effective_to is None
+            or candidate.effective_to > start
+        ]
+        for candidate in other:
+            pair = (item, candidate) if side == 0 else (candidate, item)
+            if _overlaps(*pair):
+                yield pair
+        active[side].append(item)
+
+
+def temporal_join(left, right, key, right_key=None, method=None):
+    """
+    Pairs up the items of two :class:`ERQuerySet` instances that have
+    equal join keys and are effective at the same time.
+
+    Two items are effective at the same time if each starts strictly
+    before the other ends; items with no ``effective_from`` are inert,
+    and so never paired.
+
+    If both querysets read from the same database, the pairs are found
+    by a single SQL query joining the two; otherwise, both querysets
+    are streamed in key and ``effective_from`` order and merged.
+
+    :param left: the first queryset
+    :param right: the second queryset
+    :param key: the name of the field on the first queryset's model to
+        join on (usually a foreign key)
+    :param right_key: the name of the field to join on in the second
+        queryset's model, if different
+    :param method: ``'sql'`` or ``'merge'`` to force a join method, or
+        None to choose automatically
+    :returns: an iterator of ``(left item, right item, start, end)``
+        tuples, where start and end bound the window in which both
+        items are effective, and end is None if that window has no
+        end
+    :raises ValueError: if the method is not recognised
+
+    """
+    if right_key is None:
+        right_key = key
+    if method is None:
+        method = 'sql' if left.db == right.db else 'merge'
+    if method not in ('sql', 'merge'):
+        raise ValueError('Unknown join method: {0}'.format(method))
+
+    left = left.filter(effective_from__isnull=False)
+    right = right.filter(effective_from__isnull=False)
+    join = _sql_join_items if method == 'sql' else _merge_join_items
+    for left_item, right_item in join(left, right, key, right_key):
+        start, end = _window(left_item, right_item)
+        yield left_item, right_item, start, end
+
+
+## AS-OF SNAPSHOTS ##
+
+# Holds the stack of active AsOf contexts for each thread.
+_as_of_local = threading.local()
+
+
+def active_as_of(date):
+    """
+    Returns the innermost active :class:`AsOf` context in this thread
+    for the given date, or None if there is none.
+
+    """
+    for context in reversed(getattr(_as_of_local, 'stack', ())):
+        if context.date == date:
+            return context
+    return None
+
+
+class AsOf(object):
+    """
+    Context manager for reading several effective-range models as they
+    were at one instant, from one consistent view of the database.
+
+    While the context is active, :meth:`EffectiveRangeMixin.at` for its
+    date returns the context's QuerySet for the model, which is
+    evaluated once and then shared.  The QuerySets for the given models
+    are evaluated on entry, one after another; every QuerySet is
+    evaluated inside a single transaction which, on PostgreSQL and
+    MySQL, runs at the REPEATABLE READ isolation level, so writes made
+    by others in the meantime are not seen.
+
+    The isolation level can only be set when the context starts the
+    transaction; inside an existing transaction, the reads are made in
+    a savepoint of that transaction, at its isolation level, and the
+    transaction is left for its owner to commit.
+
+    :param date: the instant to read the models at
+    :param models: the models to fetch on entry; others are fetched
+        when first asked for
+    :param using: the database to read from
+
+    """
+
+    def __init__(self, date, models=(), using=None):
+        self.date = date
+        self.models = tuple(models)
+        self.using = using or DEFAULT_DB_ALIAS
+        self._querysets = {}
+        self._transaction = None
+
+    def _begin(self):
+        """
+        Starts the context's transaction.
+
+        """
+        fresh = not transaction.is_managed(using=self.using)
+        self._transaction = commit_or_savepoint(self.using)
+        self._transaction.__enter__()
+        connection = connections[self.using]
+        if fresh and connection.vendor in ('postgresql', 'mysql'):
+            # End any transaction left open by earlier reads, so that
+            # the isolation level applies to the one these reads start.
+            transaction.commit(using=self.using)
+            connection.cursor().execute(
+                'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ'
+            )
+
+    def at(self, model):
+        """
+        Returns the evaluated QuerySet of the model's items effective
+        at the context's date.
+
+        """
+        try:
+            return self._querysets[model]
+        except KeyError:
+            pass
+        queryset = model.objects.using(self.using).at(self.date)
+        # len evaluates the QuerySet and keeps its results.
+        len(queryset)
+        self._querysets[model] = queryset
+        return queryset
+
+    def __enter__(self):
+        self._begin()
+        try:
+            for model in self.models:
+                self.at(model)
+        except:
+            exc_info = sys.exc_info()
+            self._transaction.__exit__(*exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if not hasattr(_as_of_local, 'stack'):
+            _as_of_local.stack = []
+        _as_of_local.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _as_of_local.stack.remove(self)
+        return self._transaction.__exit__(exc_type, exc_value, traceback)
@@ -3,13 +3,233 @@ submission date field.
 
 """
 
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.backends.util import truncate_name
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_syncdb
+from django.dispatch import Signal
+from django.utils import timezone
+
+from model_utils.managers import PassThroughManager
+
+from lass_utils._transaction import commit_or_savepoint
+from lass_utils.mixins.effective_range import ERQuerySet
+
+
+#: The number of items :meth:`SubmittableQuerySetMixin.submit` updates
+#: per UPDATE statement.
+SUBMIT_CHUNK_SIZE = 500
+
+#: Sent once by :meth:`SubmittableQuerySet.submit` for each batch of
+#: items it submits, with the model as sender.
+submitted = Signal(providing_args=['ids', 'date_submitted'])
+
+
+class SubmittableQuerySetMixin(object):
+    """
+    Mixin for QuerySets of :class:`SubmittableMixin` models, allowing
+    filtering on submission state.
+
+    """
+    def submitted(self):
+        """
+        Filters towards items in this QuerySet that have been
+        submitted.
+
+        """
+        return self.filter(date_submitted__isnull=False)
+
+    def unsubmitted(self):
+        """
+        Filters towards items in this QuerySet that have not been
+        submitted.
+
+        """
+        return self.filter(date_submitted__isnull=True)
+
+    def submitted_between(self, from_date, to_date):
+        """
+        Filters towards items in this QuerySet that were submitted on
+        or after from_date, but before to_date.
+
+        """
+        return self.filter(
+            date_submitted__gte=from_date,
+            date_submitted__lt=to_date
+        )
+
+    def latest_submitted(self, count):
+        """
+        Returns the count most recently submitted items in this
+        QuerySet, most recent first.
+
+        """
+        return self.submitted().order_by('-date_submitted')[:count]
+
+    def submit(self, at=None, send_signal=False):
+        """
+        Submits every unsubmitted item in this QuerySet in bulk,
+        without calling save() or sending per-item signals.
+
+        On PostgreSQL, this is a single ``UPDATE ... WHERE submitted IS
+        NULL ... RETURNING`` statement.  Elsewhere, the items are locked
+        and their primary keys read (where the backend supports
+        locking), and then those of them still unsubmitted are updated,
+        :data:`SUBMIT_CHUNK_SIZE` at a time; without locking, an item
+        submitted by someone else in between keeps its submission date
+        but is still returned.
+
+        Every statement goes to the database the model is written to,
+        unless the QuerySet was given one with ``using``.  Inside a
+        transaction, the caller's transaction is not committed.
+
+        The QuerySet must not be sliced.
+
+        :param at: the submission date to set; defaults to now
+        :param send_signal: if True, :data:`submitted` is sent once
+            for the whole batch
+        :returns: the primary keys of the items submitted
+
+        """
+        if at is None:
+            at = timezone.now()
+        # select_for_update does not mark the QuerySet as being for
+        # writing, so self.db would be the database reads are routed to.
+        alias = self._db or router.db_for_write(self.model)
+        pending = self.unsubmitted().using(alias)
+        with commit_or_savepoint(alias):
+            if connections[alias].vendor == 'postgresql':
+                ids = self._submit_returning(pending, alias, at)
+            else:
+                # Lock the rows we are about to submit, and update only
+                # those, so the ids we return are the rows updated.
+                ids = list(
+                    pending.select_for_update().values_list('pk', flat=True)
+                )
+                items = self.model._base_manager.using(alias).filter(
+                    date_submitted__isnull=True
+                )
+                for start in xrange(0, len(ids), SUBMIT_CHUNK_SIZE):
+                    items.filter(
+                        pk__in=ids[start:start + SUBMIT_CHUNK_SIZE]
+                    ).update(date_submitted=at)
+        if ids and send_signal:
+            submitted.send(
+                sender=self.model,
+                ids=ids,
+                date_submitted=at
+            )
+        return ids
+
+
+    def _submit_returning(self, pending, alias, at):
+        """
+        Submits the unsubmitted items in pending with one UPDATE,
+        returning their primary keys, on backends supporting
+        ``UPDATE ... RETURNING``.
+
+        """
+        connection = connections[alias]
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        field = opts.get_field('date_submitted')
+        subquery, params = (pending
+                            .order_by()
+                            .values_list('pk', flat=True)
+                            .query
+                            .get_compiler(using=alias)
+                            .as_sql())
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE {0} SET {1} = %s WHERE {1} IS NULL AND {2} IN ({3})'
+            ' RETURNING {2}'.format(
+                qn(opts.db_table),
+                qn(field.column),
+                qn(opts.pk.column),
+                subquery
+            ),
+            [field.get_db_prep_save(at, connection=connection)]
+            + list(params)
+        )
+        transaction.set_dirty(using=alias)
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SubmittableQuerySet(SubmittableQuerySetMixin, QuerySet):
+    """
+    Custom QuerySet allowing filtering on submission state.
+
+    """
+
+
+class SubmittableERQuerySet(SubmittableQuerySetMixin, ERQuerySet):
+    """
+    Custom QuerySet allowing filtering on both submission state and
+    date range, for models that are both :class:`SubmittableMixin` and
+    :class:`lass_utils.mixins.EffectiveRangeMixin` models.
+
+    """
+
+
+# Submittable QuerySet classes, keyed on the QuerySet class they
+# extend.
+_queryset_classes = {
+    QuerySet: SubmittableQuerySet,
+    ERQuerySet: SubmittableERQuerySet,
+}
+
+
+def submittable_manager(queryset_class=QuerySet):
+    """
+    Returns a manager whose QuerySets are of the given class, extended
+    with :class:`SubmittableQuerySetMixin`.
+
+    For example, a model that is also an effective-range model keeps
+    its ``at`` and ``in_range`` filters with::
+
+        objects = submittable_manager(ERQuerySet)
+
+    """
+    if not issubclass(queryset_class, SubmittableQuerySetMixin):
+        try:
+            queryset_class = _queryset_classes[queryset_class]
+        except KeyError:
+            queryset_class = _queryset_classes.setdefault(
+                queryset_class,
+                type(
+                    'Submittable' + queryset_class.__name__,
+                    (SubmittableQuerySetMixin, queryset_class),
+                    {}
+                )
+            )
+    return PassThroughManager.for_queryset_class(queryset_class)()
 
 
 class SubmittableMixin(models.Model):
     """A mixin for models that represent an item that must be
     submitted in order to be used.
 
+    The mixin does not replace the model's manager, so that it can be
+    combined with mixins that do.  Concrete models opt into the
+    filters in :class:`SubmittableQuerySetMixin` with a manager from
+    :func:`submittable_manager`::
+
+        objects = submittable_manager()
+
+    Concrete models can opt into indexes supporting the queries in
+    :class:`SubmittableQuerySet` by setting ``submission_indexes`` to
+    a tuple containing any of:
+
+    ``'submitted'``
+        an index on the submission date, for date-window and latest
+        submission queries;
+    ``'unsubmitted'``
+        a partial index covering only unsubmitted rows, for queues of
+        items awaiting submission.  On backends without partial
+        indexes, the ``'submitted'`` index is created instead.
+
+    The indexes are created when syncdb creates the model's table.
+
     """
 
     class Meta:
@@ -19,3 +239,116 @@ class SubmittableMixin(models.Model):
         null=True,
         auto_now_add=True,
         db_column='submitted')
+
+    submission_indexes = ()
+
+
+def supports_partial_indexes(connection):
+    """
+    Returns whether the given database connection supports partial
+    (``CREATE INDEX ... WHERE``) indexes.
+
+    """
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        import sqlite3
+        return sqlite3.sqlite_version_info >= (3, 8, 0)
+    return False
+
+
+def submission_index_sql(model, connection):
+    """
+    Returns the names of, and SQL statements needed to create, the
+    indexes requested by a :class:`SubmittableMixin` model's
+    ``submission_indexes``, as a list of ``(name, sql)`` pairs.
+
+    Names are shortened, as Django does its own index names, to fit the
+    backend's limit on identifier length.
+
+    """
+    qn = connection.ops.quote_name
+    max_length = connection.ops.max_name_length()
+    table = model._meta.db_table
+    column = model._meta.get_field('date_submitted').column
+
+    requested = set(model.submission_indexes)
+    partial = ('unsubmitted' in requested
+               and supports_partial_indexes(connection))
+    if 'unsubmitted' in requested and not partial:
+        requested.add('submitted')
+
+    statements = []
+    if 'submitted' in requested:
+        name = truncate_name('{0}_submitted'.format(table), max_length)
+        statements.append((name, 'CREATE INDEX {0} ON {1} ({2});'.format(
+            qn(name),
+            qn(table),
+            qn(column)
+        )))
+    if partial:
+        name = truncate_name('{0}_unsubmitted'.format(table), max_length)
+        statements.append((
+            name,
+            'CREATE INDEX {0} ON {1} ({2}) WHERE {3} IS NULL;'.format(
+                qn(name),
+                qn(table),
+                qn(model._meta.pk.column),
+                qn(column)
+            )
+        ))
+    return statements
+
+
+def index_exists(cursor, connection, table, name):
+    """
+    Returns whether an index with the given name exists on the given
+    table.
+
+    """
+    if connection.vendor == 'postgresql':
+        cursor.execute(
+            'SELECT 1 FROM pg_indexes WHERE tablename = %s'
+            ' AND indexname = %s',
+            [table, name]
+        )
+    elif connection.vendor == 'sqlite':
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index'"
+            ' AND tbl_name = %s AND name = %s',
+            [table, name]
+        )
+    elif connection.vendor == 'mysql':
+        cursor.execute(
+            'SHOW INDEX FROM {0} WHERE Key_name = %s'.format(
+                connection.ops.quote_name(table)
+            ),
+            [name]
+        )
+    else:
+        return False
+    return cursor.fetchone() is not None
+
+
+def create_submission_indexes(sender, app, created_models, db, **kwargs):
+    """
+    post_syncdb handler that creates the submission indexes of any
+    :class:`SubmittableMixin` models in the synced app.
+
+    As flush also sends post_syncdb, indexes that already exist are
+    skipped.
+
+    """
+    connection = connections[db]
+    app_label = app.__name__.split('.')[-2]
+    cursor = connection.cursor()
+    for model in created_models:
+        if (issubclass(model, SubmittableMixin)
+                and model._meta.app_label == app_label):
+            table = model._meta.db_table
+            for name, sql in submission_index_sql(model, connection):
+                if not index_exists(cursor, connection, table, name):
+                    cursor.execute(sql)
+
+
+post_syncdb.connect(create_submission_indexes)
@@ -13,6 +13,10 @@ The `lass_utils` module contains several model definitions under
 
 """
 
-# Import all models, in an order such that models only depend on
-# models further up the list
-from lass_utils.models.type import Type
+from lass_utils._lazy import lazy_module
+
+# Models are only imported when first used (see lass_utils._lazy).  As
+# they are all abstract, Django need not see them when loading the app.
+lazy_module(__name__, {
+    'Type': 'lass_utils.models.type',
+})
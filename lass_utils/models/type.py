@@ -12,10 +12,27 @@ base class for them.
 
 """
 
-from django.db import models
+import operator
+
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Q
 from django.core.cache import cache
 from django.http import Http404
 
+from lass_utils import routers
+from lass_utils._transaction import commit_or_savepoint
+from lass_utils.profiling import profiled
+from lass_utils.view_decorators import request_cache, request_memoise
+
+
+#: The number of names looked up per query by
+#: :meth:`Type.get_or_create_many`.
+GET_OR_CREATE_CHUNK_SIZE = 500
+
+#: The number of times :meth:`Type.get_or_create_many` tries to create
+#: missing types before giving up.
+GET_OR_CREATE_ATTEMPTS = 3
+
 
 class Type(models.Model):
     """
@@ -71,18 +88,24 @@ class Type(models.Model):
 
 
     @classmethod
+    @profiled('Type.get')
     def get(cls, identifier):
         """
         User-friendly type get function.
 
         This function uses the caching system to cache the type for
-        a short amount of time.
+        a short amount of time.  If a request cache is active (see
+        :func:`lass_utils.view_decorators.request_cached`), it is
+        consulted first.
 
         If the input is an integer, it will be treated as the target
         type's primary key.
 
         If the input is a string, it will be treated as the target
-        type's name (case-insensitively).
+        type's name (case-insensitively).  Names are not unique, so if
+        more than one type has the name (as can happen when several
+        processes create it at once), the one with the lowest primary
+        key is returned, as by :meth:`get_or_create_many`.
 
         If the input is an instance of cls itself, it will simply be
         returned.
@@ -98,27 +121,178 @@ class Type(models.Model):
         if isinstance(identifier, cls):
             result = identifier
         else:
-            cache_key = u'type-{0}-{1}-{2}'.format(
-                cls._meta.app_label,
-                cls._meta.object_name,
-                unicode(identifier).replace('-', '--').replace(' ', '-')
-                # ^-- Memcached refuses keys with spaces
+            cache_key = cls._cache_key(identifier)
+            # Look in the request cache first, if there is one, so
+            # that repeated lookups in the same request cost nothing.
+            result = request_memoise(
+                cache_key,
+                cls._get_uncached,
+                identifier,
+                cache_key
             )
-            cached = cache.get(cache_key)
-            if cached:
-                result = cached
-            elif isinstance(identifier, int):
-                result = cls.objects.get(pk=identifier)
-            elif isinstance(identifier, basestring):
-                result = cls.objects.get(name__iexact=identifier)
-            else:
-                raise TypeError(
-                    "Input of incorrect type (see docstring)."
+        return result
+
+    @classmethod
+    def _cache_key(cls, identifier):
+        """
+        Returns the key under which :meth:`get` caches the type with
+        the given identifier.
+
+        """
+        return u'type-{0}-{1}-{2}'.format(
+            cls._meta.app_label,
+            cls._meta.object_name,
+            unicode(identifier).replace('-', '--').replace(' ', '-')
+            # ^-- Memcached refuses keys with spaces
+        )
+
+    @classmethod
+    def _get_uncached(cls, identifier, cache_key):
+        """
+        Retrieves a type through the shared cache or the database,
+        bypassing the request cache.
+
+        See :meth:`get` for details.
+
+        """
+        cached = cache.get(cache_key)
+        if cached:
+            result = cached
+        elif isinstance(identifier, int):
+            result = cls._fill_queryset().get(pk=identifier)
+        elif isinstance(identifier, basestring):
+            matches = (cls._fill_queryset()
+                       .filter(name__iexact=identifier)
+                       .order_by('pk')[:1])
+            try:
+                result = matches[0]
+            except IndexError:
+                raise cls.DoesNotExist(
+                    '{0} matching query does not exist.'.format(
+                        cls._meta.object_name
+                    )
                 )
-            cache.set(cache_key, result, 60 * 60)
+        else:
+            raise TypeError(
+                "Input of incorrect type (see docstring)."
+            )
+        cache.set(cache_key, result, 60 * 60)
         return result
 
     @classmethod
+    def _fill_queryset(cls):
+        """
+        Returns the QuerySet to fill the shared cache from.
+
+        Results are cached for an hour, so they are only read from a
+        replica that is nearly up to date (see
+        :mod:`lass_utils.routers`).
+
+        """
+        return routers.on_replica(cls.objects.all(), routers.max_lag())
+
+    @classmethod
+    def _fetch_named(cls, names, using):
+        """
+        Fetches the types with the given lower-case names, returning a
+        dictionary mapping each name found onto the type with that name
+        and the lowest primary key.
+
+        """
+        found = {}
+        names = list(names)
+        for start in xrange(0, len(names), GET_OR_CREATE_CHUNK_SIZE):
+            chunk = names[start:start + GET_OR_CREATE_CHUNK_SIZE]
+            query = reduce(
+                operator.or_,
+                (Q(name__iexact=name) for name in chunk)
+            )
+            for result in (cls.objects.using(using)
+                           .filter(query)
+                           .order_by('-pk')):
+                # Ordering by descending key leaves the lowest last.
+                found[result.name.lower()] = result
+        return found
+
+    @classmethod
+    @profiled('Type.get_or_create_many')
+    def get_or_create_many(cls, names, defaults=None):
+        """
+        Retrieves the types with the given names (case-insensitively),
+        creating any that do not exist, in a handful of queries however
+        many names there are.
+
+        Existing types are fetched in one query (per
+        :data:`GET_OR_CREATE_CHUNK_SIZE` names), and missing types are
+        created with a single ``bulk_create``.  If another process
+        creates some of the same types at the same time, every caller
+        ends up with the same instances: where a name has more than
+        one type, the one with the lowest primary key wins, here and
+        in :meth:`get`.  (Give the model a unique index on ``name`` to
+        stop such duplicates being created at all.)
+
+        Every result is put in the cache used by :meth:`get`, under
+        both its name and its primary key.
+
+        :param names: the names of the types
+        :param defaults: a dictionary of other field values to give
+            created types, or a function taking a name and returning
+            such a dictionary
+        :returns: a dictionary mapping each of the given names onto its
+            type
+        :raises IntegrityError: if the missing types still cannot be
+            created after retrying
+
+        """
+        names = list(names)
+        wanted = dict((name.lower(), name) for name in names)
+        using = router.db_for_write(cls)
+
+        found = cls._fetch_named(wanted, using)
+        for attempt in xrange(GET_OR_CREATE_ATTEMPTS):
+            missing = [
+                name for lower, name in wanted.iteritems()
+                if lower not in found
+            ]
+            if not missing:
+                break
+            created = []
+            for name in missing:
+                fields = defaults(name) if callable(defaults) else defaults
+                created.append(cls(name=name, **(fields or {})))
+            with commit_or_savepoint(using):
+                savepoint = transaction.savepoint(using=using)
+                try:
+                    cls.objects.using(using).bulk_create(created)
+                except IntegrityError:
+                    # Someone else created some of these first (and
+                    # the model has a unique constraint); pick theirs
+                    # up and try again with the rest.
+                    transaction.savepoint_rollback(savepoint, using=using)
+                    if attempt == GET_OR_CREATE_ATTEMPTS - 1:
+                        raise
+                else:
+                    transaction.savepoint_commit(savepoint, using=using)
+            # bulk_create does not set primary keys, so fetch the new
+            # types (and any created concurrently) back.
+            found.update(cls._fetch_named(
+                (name.lower() for name in missing),
+                using
+            ))
+
+        results = dict((name, found[name.lower()]) for name in names)
+        cached = {}
+        for name, result in results.iteritems():
+            cached[cls._cache_key(name)] = result
+            cached[cls._cache_key(result.pk)] = result
+        cache.set_many(cached, 60 * 60)
+        local = request_cache()
+        if local is not None:
+            local.update(cached)
+        return results
+
+    @classmethod
+    @profiled('Type.get_or_404')
     def get_or_404(cls, *args, **kwargs):
         """
         Attempts to use `get` to retrieve an instance of this type,
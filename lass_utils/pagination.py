@@ -0,0 +1,176 @@
+"""
+Pagination
+----------
+
+This module defines :class:`KeysetPaginator`, a paginator for querysets
+over date-ordered models, such as those using
+:class:`lass_utils.mixins.EffectiveRangeMixin` or
+:class:`lass_utils.mixins.SubmittableMixin`.
+
+Instead of page numbers (which Django's own paginator turns into
+``OFFSET`` clauses, making every page slower than the last), each page
+hands out an opaque *cursor* naming the last item on it; the next page
+then seeks directly to the items after that one.  Given an index over
+the date column, deep pages cost the same as the first.
+
+"""
+
+import base64
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils import timezone
+
+from lass_utils.mixins.effective_range import EffectiveRangeMixin
+from lass_utils.mixins.submittable import SubmittableMixin
+
+
+_CURSOR_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def default_order_field(model):
+    """
+    Returns the name of the date field that items of the given model
+    are naturally ordered by, for use by :class:`KeysetPaginator`.
+
+    :raises ValueError: if the model has no known date ordering
+
+    """
+    if issubclass(model, EffectiveRangeMixin):
+        return model._meta.get_latest_by or 'effective_from'
+    if issubclass(model, SubmittableMixin):
+        return 'date_submitted'
+    raise ValueError(
+        'Cannot infer a date ordering for {0}.'.format(model.__name__)
+    )
+
+
+class KeysetPage(object):
+    """
+    A page of items returned by :meth:`KeysetPaginator.page`.
+
+    """
+
+    def __init__(self, object_list, next_cursor):
+        #: The items on this page.
+        self.object_list = object_list
+        #: The cursor for the next page, or None if this is the last.
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        """
+        Returns whether there is a page after this one.
+
+        """
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return '<KeysetPage of {0} items>'.format(len(self))
+
+
+class KeysetPaginator(object):
+    """
+    Paginates a queryset by seeking on a date field, with the primary
+    key as a tiebreaker.
+
+    The queryset may already be filtered (for example, by
+    :meth:`lass_utils.mixins.effective_range.ERQuerySet.in_range`);
+    any ordering it has is replaced.  Items whose date field is NULL
+    are not paginated.
+
+    :param queryset: the queryset to paginate
+    :param per_page: the maximum number of items on each page
+    :param field: the name of the date field to order by; by default,
+        this is inferred from the model with
+        :func:`default_order_field`
+    :param descending: if True (the default), pages run from the
+        latest date to the earliest
+
+    """
+
+    def __init__(self, queryset, per_page, field=None, descending=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field or default_order_field(queryset.model)
+        self.descending = descending
+
+    def page(self, cursor=None):
+        """
+        Returns the page following the given cursor, or the first page
+        if the cursor is None.
+
+        :raises InvalidPage: if the cursor is malformed
+
+        """
+        queryset = self.queryset.filter(
+            **{'{0}__isnull'.format(self.field): False}
+        )
+        if cursor is not None:
+            value, pk = self.decode_cursor(cursor)
+            inequality = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{'{0}__{1}'.format(self.field, inequality): value})
+                | Q(**{
+                    self.field: value,
+                    'pk__{0}'.format(inequality): pk
+                })
+            )
+        prefix = '-' if self.descending else ''
+        queryset = queryset.order_by(
+            prefix + self.field,
+            prefix + 'pk'
+        )
+
+        # Fetch one more item than we need to find out whether there
+        # is another page.
+        items = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            next_cursor = self.encode_cursor(items[-1])
+        return KeysetPage(items, next_cursor)
+
+    def encode_cursor(self, item):
+        """
+        Returns the cursor pointing just after the given item.
+
+        """
+        value = getattr(item, self.field)
+        suffix = ''
+        if timezone.is_aware(value):
+            value = value.astimezone(timezone.utc)
+            suffix = 'Z'
+        return base64.urlsafe_b64encode('{0}{1}|{2}'.format(
+            value.strftime(_CURSOR_FORMAT),
+            suffix,
+            item.pk
+        ))
+
+    def decode_cursor(self, cursor):
+        """
+        Returns the date and primary key named by the given cursor.
+
+        :raises InvalidPage: if the cursor is malformed
+
+        """
+        try:
+            value, pk = base64.urlsafe_b64decode(str(cursor)).split('|', 1)
+            aware = value.endswith('Z')
+            value = datetime.datetime.strptime(
+                value.rstrip('Z'),
+                _CURSOR_FORMAT
+            )
+            pk = self.queryset.model._meta.pk.to_python(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise InvalidPage('Malformed cursor.')
+        if aware:
+            value = value.replace(tzinfo=timezone.utc)
+        return value, pk
@@ -0,0 +1,321 @@
+"""
+Profiling
+---------
+
+This module provides hooks for attributing database load to the
+helpers in ``lass_utils`` (:meth:`lass_utils.models.Type.get`,
+:meth:`lass_utils.mixins.effective_range.ERQuerySet.in_range` and so
+on).
+
+Profiling is off by default, and switched on for the whole process
+by :func:`enable` or for the duration of a :class:`Profile` context.
+Both can be nested and used from several threads at once: profiling
+stays on until every :func:`enable` has been matched by a
+:func:`disable`.
+While it is on, every call to a profiled helper records the number of
+queries it made, the number of rows it fetched and the time it took.
+Each record is sent out through the :data:`helper_profiled` signal and
+collected by any active :class:`Profile`.
+
+Helpers returning QuerySets are recorded when the QuerySet is
+evaluated, rather than when it is created, as that is when the
+database is hit.
+
+While profiling is off, a profiled helper costs one extra function
+call and a global lookup.  Django's connections belong to threads, so
+each thread's connections are only switched to recording queries
+when the thread first calls a profiled helper while profiling is on.
+
+"""
+
+import functools
+import logging
+import threading
+import time
+
+from django.core.signals import request_finished
+from django.db import connections
+from django.dispatch import Signal
+
+
+#: Sent for each profiled helper call, with the helper name as sender.
+helper_profiled = Signal(
+    providing_args=['helper', 'queries', 'rows', 'elapsed']
+)
+
+logger = logging.getLogger(__name__)
+
+# Whether profiling is on.  This is read on every profiled helper
+# call, so is kept as a plain module global.
+enabled = False
+
+# The number of enable calls not yet matched by disable calls.
+_enable_count = 0
+_enable_lock = threading.Lock()
+
+# Holds, for each thread, the stack of active Profiles and the
+# connections switched to recording queries (with the setting each
+# had before).
+_local = threading.local()
+
+
+def enable():
+    """
+    Switches profiling on for this process, until matched by a call to
+    :func:`disable`.
+
+    While profiling is on, Django records every query made in a thread
+    that has called a profiled helper (as it does when ``DEBUG`` is
+    on), so it should not be left on in long-running processes outside
+    of requests.
+
+    """
+    global enabled, _enable_count
+    with _enable_lock:
+        _enable_count += 1
+        enabled = True
+
+
+def disable():
+    """
+    Undoes one call to :func:`enable`, switching profiling off for
+    this process if there are no others.
+
+    """
+    global enabled, _enable_count
+    with _enable_lock:
+        _enable_count = max(_enable_count - 1, 0)
+        enabled = _enable_count > 0
+    if not enabled:
+        _restore_cursors()
+
+
+def _record_queries():
+    """
+    Switches this thread's connections to recording queries, if they
+    have not been already.
+
+    """
+    if getattr(_local, 'connections', None) is None:
+        _local.connections = [
+            (connection, connection.use_debug_cursor)
+            for connection in connections.all()
+        ]
+        for connection, _ in _local.connections:
+            connection.use_debug_cursor = True
+
+
+def _restore_cursors(**kwargs):
+    """
+    Switches this thread's connections back from recording queries, if
+    it has no active :class:`Profile`.
+
+    """
+    if getattr(_local, 'profiles', None):
+        return
+    for connection, setting in getattr(_local, 'connections', None) or ():
+        connection.use_debug_cursor = setting
+    _local.connections = None
+
+
+# Threads serving requests stop recording once each request is done;
+# they start again on their next profiled call if profiling is on.
+request_finished.connect(_restore_cursors)
+
+
+
+def _query_count():
+    """
+    Returns the number of queries recorded across all connections.
+
+    """
+    return sum(len(connection.queries) for connection in connections.all())
+
+
+def _count_rows(result):
+    """
+    Returns the number of rows a helper's result represents, or None if
+    it is not known (for example, for an unevaluated QuerySet).
+
+    """
+    if isinstance(result, (list, tuple, dict)):
+        return len(result)
+    if hasattr(result, '_meta'):
+        return 1
+    return None
+
+
+def count_rows(rows):
+    """
+    Reports, from inside a profiled helper, that the helper fetched the
+    given number of rows.
+
+    Helpers whose results do not show how many rows they fetched (for
+    example, because they return their arguments) call this, and their
+    calls are recorded with the total reported, rather than with a
+    count taken from the result.
+
+    """
+    if enabled:
+        counts = getattr(_local, 'row_counts', None)
+        if counts:
+            counts[-1] = (counts[-1] or 0) + rows
+
+
+def _record(helper, queries, rows, elapsed):
+    """
+    Records one call to a profiled helper.
+
+    """
+    for profile in getattr(_local, 'profiles', ()):
+        profile.record(helper, queries, rows, elapsed)
+    helper_profiled.send(
+        sender=helper,
+        helper=helper,
+        queries=queries,
+        rows=rows,
+        elapsed=elapsed
+    )
+
+
+def profiled(helper):
+    """
+    Decorator marking a function as a profiled helper with the given
+    name.
+
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            _record_queries()
+            if getattr(_local, 'row_counts', None) is None:
+                _local.row_counts = []
+            _local.row_counts.append(None)
+            queries = _query_count()
+            start = time.time()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                rows = _local.row_counts.pop()
+            _record(
+                helper,
+                _query_count() - queries,
+                _count_rows(result) if rows is None else rows,
+                time.time() - start
+            )
+            return result
+        return wrapper
+    return decorator
+
+
+def profile_iterator(helper, iterator):
+    """
+    Wraps an iterator over rows, recording it as one call to the given
+    helper once it is exhausted.
+
+    Only the time and queries spent fetching rows are counted, not
+    those spent by the consumer between rows.
+
+    """
+    _record_queries()
+    queries = 0
+    rows = 0
+    elapsed = 0
+    while True:
+        before = _query_count()
+        start = time.time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            elapsed += time.time() - start
+            queries += _query_count() - before
+        rows += 1
+        yield item
+    _record(helper, queries, rows, elapsed)
+
+
+class Profile(object):
+    """
+    Context manager that switches profiling on and collects the
+    records of every profiled helper called in this thread while it
+    is active.
+
+    """
+
+    def __init__(self):
+        #: (helper, queries, rows, elapsed) tuples, in call order.
+        self.records = []
+
+    def record(self, helper, queries, rows, elapsed):
+        """
+        Adds a record of one helper call.
+
+        """
+        self.records.append((helper, queries, rows, elapsed))
+
+    def summary(self):
+        """
+        Returns the totals for each helper, as a dictionary mapping
+        helper names to dictionaries of ``calls``, ``queries``,
+        ``rows`` (counting only calls where it is known) and
+        ``elapsed``.
+
+        """
+        totals = {}
+        for helper, queries, rows, elapsed in self.records:
+            total = totals.setdefault(
+                helper,
+                dict(calls=0, queries=0, rows=0, elapsed=0)
+            )
+            total['calls'] += 1
+            total['queries'] += queries
+            total['rows'] += rows or 0
+            total['elapsed'] += elapsed
+        return totals
+
+    def __enter__(self):
+        enable()
+        if not hasattr(_local, 'profiles'):
+            _local.profiles = []
+        _local.profiles.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.profiles.remove(self)
+        disable()
+        _restore_cursors()
+
+
+class ProfilingMiddleware(object):
+    """
+    Middleware that profiles each request, storing the
+    :class:`Profile` as ``request.lass_profile`` and logging its
+    summary to the ``lass_utils.profiling`` logger at DEBUG level.
+
+    """
+
+    def process_request(self, request):
+        """Starts profiling the request."""
+        request.lass_profile = Profile().__enter__()
+
+    def process_response(self, request, response):
+        """Stops profiling the request and reports on it."""
+        profile = getattr(request, 'lass_profile', None)
+        if profile is not None and profile in getattr(_local, 'profiles', ()):
+            profile.__exit__(None, None, None)
+            for helper, total in sorted(profile.summary().items()):
+                logger.debug(
+                    '%s %s: %s: %d calls, %d queries, %d rows, %.2f ms',
+                    request.method,
+                    request.path,
+                    helper,
+                    total['calls'],
+                    total['queries'],
+                    total['rows'],
+                    total['elapsed'] * 1e3
+                )
+        return response
@@ -0,0 +1,287 @@
+"""
+Recurrence
+----------
+
+This module expands recurring items, such as a show broadcast every
+Tuesday at 8pm, into the concrete slots falling in a window of time.
+
+A recurrence is described by a rule: :class:`WeeklyRule` (every week,
+or every n-th week, on a weekday), :class:`MonthlyRule` (on a day of
+each month) or :class:`ISOWeekRule` (on a weekday of chosen ISO weeks
+of each year).  Each rule can be bounded by first and last dates and
+can skip exception dates.
+
+:meth:`Rule.slots` expands a rule lazily, yielding :class:`Slot`
+objects (which implement :class:`lass_utils.mixins.DateRangeMixin`)
+for the occurrences overlapping a window.  The first occurrence in the
+window is found by arithmetic rather than by stepping from the start
+of the rule, so the cost of an expansion depends only on the size of
+the window.  :func:`merge` interleaves the slots of several rules, and
+the items of :class:`lass_utils.mixins.EffectiveRangeMixin` querysets,
+in order of start.
+
+Weekdays are numbered as in ISO weeks (and
+:func:`lass_utils.view_decorators.date_normalise`): 1 is Monday and 7
+is Sunday.
+
+"""
+
+import datetime
+import heapq
+import itertools
+
+from django.conf import settings
+from django.utils import timezone
+
+from lass_utils.mixins.date_range import DateRangeMixin
+from lass_utils.view_decorators import (
+    iso_to_gregorian,
+    iso_weeks_in_year,
+    month_start,
+    next_month_start,
+    week_start
+)
+
+
+class Slot(DateRangeMixin):
+    """
+    One occurrence of a recurring item, with the :class:`Rule` it
+    came from.
+
+    """
+    __slots__ = ('start', 'end', 'rule')
+
+    def __init__(self, start, end, rule):
+        self.start = start
+        self.end = end
+        self.rule = rule
+
+    def range_start(self):
+        return self.start
+
+    def range_end(self):
+        return self.end
+
+    def __eq__(self, other):
+        return (isinstance(other, Slot)
+                and (self.start, self.end, self.rule)
+                == (other.start, other.end, other.rule))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.start, self.end))
+
+    def __repr__(self):
+        return '<Slot {0} to {1}>'.format(self.start, self.end)
+
+
+class Rule(object):
+    """
+    Base class for recurrence rules.
+
+    Subclasses provide :meth:`dates`, which yields the dates on which
+    the rule occurs within a span of dates.
+
+    :param time: the local time at which each occurrence starts
+    :param duration: how long each occurrence lasts, as a timedelta
+    :param first: the first date on which the rule may occur, if any
+    :param last: the last date on which the rule may occur, if any
+    :param exceptions: dates on which the rule does not occur
+    :param tz: the time zone the rule's times are in; defaults to the
+        current time zone
+
+    """
+
+    def __init__(self,
+                 time,
+                 duration,
+                 first=None,
+                 last=None,
+                 exceptions=(),
+                 tz=None):
+        self.time = time
+        self.duration = duration
+        self.first = first
+        self.last = last
+        self.exceptions = frozenset(exceptions)
+        self.tz = tz
+
+    def dates(self, first, last):
+        """
+        Yields, in order, the dates from first to last (inclusive) on
+        which the rule occurs, ignoring its bounds and exceptions.
+
+        Must be overridden in descended classes.
+
+        """
+        raise NotImplementedError('dates not implemented')
+
+    def _timezone(self):
+        return self.tz or timezone.get_current_timezone()
+
+    def _local_date(self, value):
+        """
+        Returns the date of a datetime in the rule's time zone.
+
+        """
+        if settings.USE_TZ and timezone.is_aware(value):
+            value = value.astimezone(self._timezone())
+        return value.date()
+
+    def start_on(self, date):
+        """
+        Returns the instant the occurrence on the given date starts.
+
+        If time zone support is on, this is an aware datetime; a start
+        time skipped by a daylight saving change is moved forward.
+
+        """
+        start = datetime.datetime.combine(date, self.time)
+        if not settings.USE_TZ:
+            return start
+        tz = self._timezone()
+        if hasattr(tz, 'localize'):
+            return tz.normalize(tz.localize(start, is_dst=False))
+        return start.replace(tzinfo=tz)
+
+    def slots(self, start, end):
+        """
+        Lazily yields, in order, a :class:`Slot` for each occurrence of
+        the rule overlapping the window from start (inclusive) to end
+        (exclusive).
+
+        """
+        first = self._local_date(start - self.duration)
+        last = self._local_date(end)
+        if self.first is not None:
+            first = max(first, self.first)
+        if self.last is not None:
+            last = min(last, self.last)
+        if first > last:
+            return
+
+        for date in self.dates(first, last):
+            if date in self.exceptions:
+                continue
+            slot_start = self.start_on(date)
+            slot_end = slot_start + self.duration
+            if slot_start < end and slot_end > start:
+                yield Slot(slot_start, slot_end, self)
+
+
+class WeeklyRule(Rule):
+    """
+    A rule occurring on a weekday every week, or every interval weeks
+    counting from the week of its first date.
+
+    :param weekday: the ISO weekday (1 to 7) of each occurrence
+
+    """
+
+    def __init__(self, weekday, time, duration, interval=1, **kwargs):
+        super(WeeklyRule, self).__init__(time, duration, **kwargs)
+        if interval > 1 and self.first is None:
+            raise ValueError('Weekly rules with intervals need a first '
+                             'date')
+        self.weekday = weekday
+        self.interval = interval
+
+    def dates(self, first, last):
+        date = week_start(first) + datetime.timedelta(days=self.weekday - 1)
+        if self.interval > 1:
+            # Skip to the next week in step with the first date's week.
+            weeks = (date - week_start(self.first)).days // 7
+            date += datetime.timedelta(weeks=-weeks % self.interval)
+        step = datetime.timedelta(weeks=self.interval)
+        if date < first:
+            date += step
+        while date <= last:
+            yield date
+            date += step
+
+
+class MonthlyRule(Rule):
+    """
+    A rule occurring on a day of every month.  Months without that day
+    (such as February, for the 30th) are skipped.
+
+    :param day: the day of the month (1 to 31) of each occurrence
+
+    """
+
+    def __init__(self, day, time, duration, **kwargs):
+        super(MonthlyRule, self).__init__(time, duration, **kwargs)
+        self.day = day
+
+    def dates(self, first, last):
+        month = month_start(first)
+        while month <= last:
+            try:
+                date = month.replace(day=self.day)
+            except ValueError:
+                pass
+            else:
+                if first <= date <= last:
+                    yield date
+            month = next_month_start(month)
+
+
+class ISOWeekRule(Rule):
+    """
+    A rule occurring on a weekday of chosen ISO weeks of every year,
+    such as "Fridays of even weeks".
+
+    :param weekday: the ISO weekday (1 to 7) of each occurrence
+    :param weeks: the ISO week numbers (1 to 53) to occur in; weeks
+        numbered 53 only occur in years that have them
+
+    """
+
+    def __init__(self, weekday, weeks, time, duration, **kwargs):
+        super(ISOWeekRule, self).__init__(time, duration, **kwargs)
+        self.weekday = weekday
+        self.weeks = frozenset(weeks)
+
+    def dates(self, first, last):
+        iso_year, iso_week, _ = first.isocalendar()
+        while True:
+            if iso_week > iso_weeks_in_year(iso_year):
+                iso_year += 1
+                iso_week = 1
+            date = iso_to_gregorian(iso_year, iso_week, self.weekday)
+            if date > last:
+                break
+            if iso_week in self.weeks and date >= first:
+                yield date
+            iso_week += 1
+
+
+def merge(start, end, rules=(), querysets=()):
+    """
+    Lazily yields, in order of start, the slots of the given rules and
+    the items of the given :class:`EffectiveRangeMixin` querysets that
+    overlap the window from start (inclusive) to end (exclusive).
+
+    Both slots and items implement :class:`DateRangeMixin`.  Queryset
+    items with no ``effective_to`` are treated as never ending.
+
+    """
+    sources = [rule.slots(start, end) for rule in rules]
+    sources.extend(
+        queryset
+        .filter(effective_from__lt=end)
+        .exclude(effective_to__lte=start)
+        .order_by('effective_from')
+        .iterator()
+        for queryset in querysets
+    )
+    # The counter keeps the items themselves from being compared.
+    counter = itertools.count()
+    keyed = [
+        ((item.range_start(), next(counter), item) for item in source)
+        for source in sources
+    ]
+    for _, _, item in heapq.merge(*keyed):
+        yield item
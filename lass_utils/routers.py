@@ -0,0 +1,290 @@
+"""
+Routers
+-------
+
+This module sends the read-only traffic of ``lass_utils`` helpers to
+read replicas, keeping the primary database for writes.
+
+:class:`ReplicaRouter` is a database router (add
+``'lass_utils.routers.ReplicaRouter'`` to ``DATABASE_ROUTERS``) that
+sends reads to the aliases in the ``LASS_REPLICA_DATABASES`` setting,
+and writes to the primary (``LASS_PRIMARY_DATABASE``, by default
+``'default'``).
+
+Replicas lag behind the primary, so a thread that has just written is
+*pinned* to the primary for ``LASS_REPLICA_STICKY_SECONDS`` seconds
+(5 by default), so that it reads its own writes.
+:class:`ReplicaPinningMiddleware` carries the pin over to the same
+client's following requests, through a cookie.
+
+Reads whose results outlive the request, such as
+:meth:`lass_utils.models.Type.get` filling the shared cache, only go
+to a replica whose lag is known to be under ``LASS_REPLICA_MAX_LAG``
+seconds; see :func:`read_alias`.
+
+"""
+
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+#: The name of the cookie used by :class:`ReplicaPinningMiddleware`.
+PIN_COOKIE = 'lass_pin_primary'
+
+# Holds the time each thread is pinned to the primary until.
+_local = threading.local()
+
+# Maps replica aliases onto (time measured, lag in seconds) pairs.
+_lags = {}
+
+#: How long, in seconds, a replica's measured lag is trusted for.
+LAG_CHECK_SECONDS = 5
+
+
+def primary():
+    """
+    Returns the alias of the primary database.
+
+    """
+    return getattr(settings, 'LASS_PRIMARY_DATABASE', DEFAULT_DB_ALIAS)
+
+
+def replicas():
+    """
+    Returns the aliases of the read replicas.
+
+    """
+    return tuple(getattr(settings, 'LASS_REPLICA_DATABASES', ()))
+
+
+def max_lag():
+    """
+    Returns the most lag, in seconds, a replica may have and still be
+    used for reads that outlive the request.
+
+    """
+    return getattr(settings, 'LASS_REPLICA_MAX_LAG', 1)
+
+
+def sticky_seconds():
+    """
+    Returns how long, in seconds, a thread that writes is pinned to the
+    primary for.
+
+    """
+    return getattr(settings, 'LASS_REPLICA_STICKY_SECONDS', 5)
+
+
+def pin(seconds=None):
+    """
+    Pins this thread to the primary for the given number of seconds
+    (by default, :func:`sticky_seconds`).
+
+    An existing pin is only ever extended, never shortened.
+
+    """
+    if seconds is None:
+        seconds = sticky_seconds()
+    _local.pinned_until = max(pinned_until(), time.time() + seconds)
+
+
+def unpin():
+    """
+    Removes this thread's pin to the primary.
+
+    """
+    _local.pinned_until = 0
+
+
+def pinned_until():
+    """
+    Returns the time, as a UNIX timestamp, this thread is pinned to
+    the primary until; this is in the past if it is not pinned.
+
+    """
+    return getattr(_local, 'pinned_until', 0)
+
+
+def is_pinned():
+    """
+    Returns whether this thread is pinned to the primary.
+
+    """
+    return pinned_until() > time.time()
+
+
+def _postgresql_lag_sql(server_version):
+    """
+    Returns the query measuring a PostgreSQL replica's lag, for the
+    given server version (as an integer such as 90603).
+
+    The time since the last transaction replayed is only lag while the
+    replica has received changes it has not yet replayed; on a quiet
+    primary it just grows, so a replica that has caught up reports no
+    lag.
+
+    """
+    if server_version >= 100000:
+        received, replayed = (
+            'pg_last_wal_receive_lsn',
+            'pg_last_wal_replay_lsn'
+        )
+    else:
+        received, replayed = (
+            'pg_last_xlog_receive_location',
+            'pg_last_xlog_replay_location'
+        )
+    return (
+        'SELECT CASE WHEN {0}() = {1}() THEN 0 '
+        'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+        'END'
+    ).format(received, replayed)
+
+
+def replica_lag(alias):
+    """
+    Returns how far, in seconds, the given replica is behind the
+    primary, or None if this cannot be found out.
+
+    Lag is measured on PostgreSQL and MySQL replicas; other backends
+    always give None.  Measurements are reused for
+    :data:`LAG_CHECK_SECONDS`.
+
+    """
+    now = time.time()
+    try:
+        measured, lag = _lags[alias]
+    except KeyError:
+        pass
+    else:
+        if now - measured < LAG_CHECK_SECONDS:
+            return lag
+
+    connection = connections[alias]
+    vendor = connection.vendor
+    lag = None
+    try:
+        cursor = connection.cursor()
+        if vendor == 'postgresql':
+            cursor.execute(_postgresql_lag_sql(
+                connection.connection.server_version
+            ))
+            lag = cursor.fetchone()[0]
+        elif vendor == 'mysql':
+            cursor.execute('SHOW SLAVE STATUS')
+            row = cursor.fetchone()
+            if row is not None:
+                columns = [column[0] for column in cursor.description]
+                lag = dict(zip(columns, row)).get('Seconds_Behind_Master')
+    except DatabaseError:
+        # An unreachable replica is as good as an infinitely lagging
+        # one.
+        lag = None
+    if lag is not None:
+        lag = float(lag)
+    _lags[alias] = (now, lag)
+    return lag
+
+
+def read_alias(max_lag=None):
+    """
+    Returns the alias of a database to read from, or None if reads
+    should be routed as normal.
+
+    None is returned if there are no replicas or this thread is pinned
+    to the primary.  If max_lag is given, only replicas known to be
+    lagging by no more than max_lag seconds are considered, and the
+    primary is returned if there are none.
+
+    """
+    aliases = replicas()
+    if not aliases or is_pinned():
+        return None
+    if max_lag is not None:
+        lags = [(alias, replica_lag(alias)) for alias in aliases]
+        aliases = [
+            alias for alias, lag in lags
+            if lag is not None and lag <= max_lag
+        ]
+        if not aliases:
+            return primary()
+    return random.choice(aliases)
+
+
+def on_replica(queryset, max_lag=None):
+    """
+    Returns a queryset reading from the database chosen by
+    :func:`read_alias`, whether or not :class:`ReplicaRouter` is
+    installed.
+
+    """
+    alias = read_alias(max_lag)
+    if alias is None:
+        return queryset
+    return queryset.using(alias)
+
+
+class ReplicaRouter(object):
+    """
+    Database router sending reads to replicas and writes to the
+    primary, pinning the current thread to the primary whenever it
+    writes.
+
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_alias() or primary()
+
+    def db_for_write(self, model, **hints):
+        pin()
+        return primary()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = set(replicas())
+        aliases.add(primary())
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware(object):
+    """
+    Middleware keeping clients that have just written pinned to the
+    primary across requests, using the :data:`PIN_COOKIE` cookie.
+
+    """
+
+    def process_request(self, request):
+        """Restores any pin the client had."""
+        unpin()
+        try:
+            until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            until = 0
+        # The cookie comes from the client, so is not trusted to pin
+        # for longer than a write would.
+        remaining = min(until - time.time(), sticky_seconds())
+        if remaining > 0:
+            pin(remaining)
+        request.lass_pinned_until = pinned_until()
+
+    def process_response(self, request, response):
+        """Passes on to the client any pin made by the request."""
+        until = pinned_until()
+        if until > getattr(request, 'lass_pinned_until', 0):
+            response.set_cookie(
+                PIN_COOKIE,
+                '{0:.3f}'.format(until),
+                max_age=int(until - time.time()) + 1
+            )
+        unpin()
+        return response
@@ -0,0 +1,384 @@
+"""
+Snapshots
+---------
+
+This module exports the state of an
+:class:`lass_utils.mixins.EffectiveRangeMixin` queryset to a compact
+columnar file, and reads such files back through a memory map, so that
+batch jobs can ask "what was effective when" of a snapshot rather than
+of the live database.
+
+A snapshot holds, for each item with an ``effective_from``, its
+primary key, its effective range and any other integer, boolean or
+floating-point fields asked for.  Items are stored in order of
+``effective_from``, so :meth:`Snapshot.in_range` and
+:meth:`Snapshot.at` can find candidates by binary search.
+
+Columns are read in place from the memory map, without copying; if
+NumPy is installed, they are exposed as NumPy arrays and queries are
+vectorised.
+
+The file format is a header (see :data:`MAGIC`), a table of column
+names and type codes, and then each column in turn as a run of
+little-endian 8-byte values, starting on an 8-byte boundary.
+Datetimes are stored as microseconds since the UNIX epoch, in UTC.
+
+"""
+
+import bisect
+import datetime
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from lass_utils.time_utils import EPOCH, to_unix
+
+
+#: The bytes every snapshot file starts with.
+MAGIC = 'LASSSNAP'
+
+#: The version of the file format written by :func:`export_snapshot`.
+VERSION = 1
+
+#: Stored for NULL integers, and for an ``effective_to`` of NULL.
+NULL_INTEGER = -2 ** 63
+NULL_TO = 2 ** 63 - 1
+
+# Magic, version, flags, row count and column count.
+_HEADER = struct.Struct('<8sIIQI')
+_COLUMN = struct.Struct('<Hc')
+
+# Set in the header flags if datetimes were time zone aware.
+_AWARE = 1
+
+# Rows packed at a time while exporting.
+_CHUNK_SIZE = 4096
+
+# The columns every snapshot has, before any extra fields.
+_RANGE_COLUMNS = (('pk', 'q'), ('effective_from', 'q'), ('effective_to', 'q'))
+
+_INTEGER_TYPES = frozenset((
+    'AutoField',
+    'BigIntegerField',
+    'BooleanField',
+    'ForeignKey',
+    'IntegerField',
+    'OneToOneField',
+    'PositiveIntegerField',
+    'PositiveSmallIntegerField',
+    'SmallIntegerField',
+))
+
+
+def _to_micros(value):
+    """
+    Returns a datetime as microseconds since the UNIX epoch.
+
+    """
+    return to_unix(value) * 1000000 + value.microsecond
+
+
+def _type_code(model, name):
+    """
+    Returns the struct type code a field is stored as.
+
+    :raises ValueError: if the field cannot be stored in a snapshot
+
+    """
+    field_type = model._meta.get_field(name).get_internal_type()
+    if field_type in _INTEGER_TYPES:
+        return 'q'
+    if field_type == 'FloatField':
+        return 'd'
+    raise ValueError(
+        'Cannot store {0} field {1} in a snapshot'.format(field_type, name)
+    )
+
+
+def _pack(code, values):
+    """
+    Packs a column's values, replacing NULLs with the column's NULL
+    value.
+
+    """
+    null = NULL_INTEGER if code == 'q' else float('nan')
+    return struct.pack(
+        '<{0}{1}'.format(len(values), code),
+        *[null if value is None else value for value in values]
+    )
+
+
+def export_snapshot(queryset, path, fields=()):
+    """
+    Writes a snapshot of an :class:`EffectiveRangeMixin` queryset to a
+    file.
+
+    Rows are streamed from the database and written a chunk at a time
+    to one temporary file per column, so memory use does not grow with
+    the size of the queryset.  The snapshot replaces any file at path
+    only once it is complete.
+
+    :param queryset: the queryset (or manager) to export
+    :param path: the path of the file to write
+    :param fields: the names of any other integer, boolean, foreign
+        key or floating-point fields to store
+    :returns: the number of rows written
+    :raises ValueError: if a field cannot be stored in a snapshot
+
+    """
+    model = queryset.model
+    columns = list(_RANGE_COLUMNS)
+    columns.extend((name, _type_code(model, name)) for name in fields)
+
+    rows = (queryset
+            .filter(effective_from__isnull=False)
+            .order_by('effective_from', 'pk')
+            .values_list('pk', 'effective_from', 'effective_to', *fields)
+            .iterator())
+
+    aware = settings.USE_TZ
+    parts = [tempfile.TemporaryFile() for _ in columns]
+    count = 0
+    try:
+        while True:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == _CHUNK_SIZE:
+                    break
+            if not chunk:
+                break
+            count += len(chunk)
+            values = zip(*chunk)
+            values[1] = [_to_micros(value) for value in values[1]]
+            values[2] = [
+                NULL_TO if value is None else _to_micros(value)
+                for value in values[2]
+            ]
+            for part, (_, code), column in zip(parts, columns, values):
+                part.write(_pack(code, column))
+
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(handle, 'wb') as snapshot:
+                snapshot.write(_HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    _AWARE if aware else 0,
+                    count,
+                    len(columns)
+                ))
+                for name, code in columns:
+                    snapshot.write(_COLUMN.pack(len(name), code))
+                    snapshot.write(name)
+                snapshot.write('\0' * (-snapshot.tell() % 8))
+                for part in parts:
+                    part.seek(0)
+                    shutil.copyfileobj(part, snapshot)
+            os.rename(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+    finally:
+        for part in parts:
+            part.close()
+    return count
+
+
+class _Column(object):
+    """
+    A read-only sequence over a column in a memory map, unpacking
+    each value as it is asked for.
+
+    """
+
+    def __init__(self, buffer, offset, count, code):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._format = '<' + code
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('snapshot column index out of range')
+        return struct.unpack_from(
+            self._format,
+            self._buffer,
+            self._offset + index * 8
+        )[0]
+
+    def __iter__(self):
+        for index in xrange(self._count):
+            yield self[index]
+
+
+class Snapshot(object):
+    """
+    A snapshot file written by :func:`export_snapshot`, memory-mapped
+    for reading.
+
+    Snapshots can be used as context managers, closing the file on
+    exit.
+
+    :param path: the path of the snapshot file
+    :raises ValueError: if the file is not a snapshot, or was written
+        in a newer format
+
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as snapshot:
+            self._map = mmap.mmap(
+                snapshot.fileno(),
+                0,
+                access=mmap.ACCESS_READ
+            )
+        try:
+            magic, version, flags, count, column_count = (
+                _HEADER.unpack_from(self._map)
+            )
+            if magic != MAGIC or version > VERSION:
+                raise ValueError('{0} is not a snapshot'.format(path))
+            self.aware = bool(flags & _AWARE)
+            self.count = count
+
+            offset = _HEADER.size
+            self.fields = []
+            codes = []
+            for _ in xrange(column_count):
+                length, code = _COLUMN.unpack_from(self._map, offset)
+                offset += _COLUMN.size
+                self.fields.append(self._map[offset:offset + length])
+                codes.append(code)
+                offset += length
+            offset += -offset % 8
+        except struct.error:
+            self._map.close()
+            raise ValueError('{0} is not a snapshot'.format(path))
+
+        self._columns = {}
+        for name, code in zip(self.fields, codes):
+            if numpy is not None:
+                column = numpy.frombuffer(
+                    self._map,
+                    dtype='<i8' if code == 'q' else '<f8',
+                    count=count,
+                    offset=offset
+                )
+            else:
+                column = _Column(self._map, offset, count, code)
+            self._columns[name] = column
+            offset += count * 8
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the memory map.  Columns must not be used afterwards.
+
+        """
+        self._columns = {}
+        self._map.close()
+
+    def column(self, name):
+        """
+        Returns a column of the snapshot, in ``effective_from`` order,
+        as stored: datetimes as microseconds since the epoch, and
+        NULLs as :data:`NULL_INTEGER` (or :data:`NULL_TO`) or NaN.
+
+        If NumPy is installed, this is a read-only NumPy array over the
+        memory map; otherwise it is a sequence reading from the map.
+
+        """
+        return self._columns[name]
+
+    def in_range(self, from_date, to_date):
+        """
+        Returns the indices of the rows effective during the whole of
+        the given date range, as :meth:`ERQuerySet.in_range` would
+        select them.
+
+        """
+        starts = self._columns['effective_from']
+        ends = self._columns['effective_to']
+        from_micros = _to_micros(from_date)
+        to_micros = _to_micros(to_date)
+        if numpy is not None:
+            candidates = numpy.searchsorted(starts, from_micros, 'right')
+            return numpy.flatnonzero(ends[:candidates] >= to_micros)
+        candidates = bisect.bisect_right(starts, from_micros)
+        return [
+            index for index in xrange(candidates)
+            if ends[index] >= to_micros
+        ]
+
+    def at(self, date):
+        """
+        Returns the indices of the rows effective at the given moment,
+        as :meth:`ERQuerySet.at` would select them.
+
+        """
+        return self.in_range(date, date)
+
+    def _datetime(self, micros):
+        """
+        Converts stored microseconds back into a datetime.
+
+        """
+        value = EPOCH + datetime.timedelta(microseconds=int(micros))
+        if not self.aware:
+            value = value.replace(tzinfo=None)
+        return value
+
+    def row(self, index):
+        """
+        Returns the given row as a dictionary mapping field names
+        (including ``pk``) to values, with datetimes and NULLs as they
+        were in the database.
+
+        """
+        row = {}
+        for name in self.fields:
+            value = self._columns[name][index]
+            if name in ('effective_from', 'effective_to'):
+                value = (None if value == NULL_TO
+                         else self._datetime(value))
+            elif value == NULL_INTEGER or value != value:
+                value = None
+            elif hasattr(value, 'item'):
+                value = value.item()
+            row[name] = value
+        return row
+
+    def rows(self, indices):
+        """
+        Yields the rows with the given indices, as given by
+        :meth:`row`.
+
+        """
+        for index in indices:
+            yield self.row(index)
@@ -3,12 +3,58 @@ Test suite for the ``lass_utils`` package.
 
 """
 
+import calendar
 import datetime
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.paginator import InvalidPage
+from django.db import connection, models, router, transaction
+from django.http import Http404, HttpResponse
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone, unittest
+
+try:
+    import pytz
+except ImportError:
+    pytz = None
 
 from lass_utils.models import Type
-from lass_utils import view_decorators
+from lass_utils.mixins import (
+    AttachableMixin,
+    EffectiveRangeMixin,
+    SubmittableMixin
+)
+from lass_utils.mixins import effective_range, submittable
+from lass_utils.mixins.attachable import (
+    LazyModel,
+    build_pending_models,
+    prefetch_attachables
+)
+from lass_utils import (
+    aggregation,
+    generators,
+    invalidation,
+    profiling,
+    recurrence,
+    routers,
+    snapshot,
+    time_utils,
+    view_decorators
+)
+from lass_utils.management.commands import check_effective_ranges
+from lass_utils.pagination import KeysetPaginator
 
 
 @view_decorators.date_normalise
@@ -156,6 +202,49 @@ class DateNormaliseTest(TestCase):
             )
         )
 
+    def test_string_arguments(self):
+        """Ensures that string arguments, as given by URLconfs, work.
+        """
+        self.assertEqual(
+            fake_view(None, year='1993', month='02', day='13'),
+            self.date
+        )
+        self.assertEqual(
+            fake_view(None, year='1993', week='6', weekday='6'),
+            self.date
+        )
+        self.assertEqual(
+            fake_view(None, year='1993', month='2', day=''),
+            self.date.replace(day=1)
+        )
+
+    def test_invalid_dates(self):
+        """Ensures that impossible dates raise Http404.
+        """
+        for kwargs in (
+            dict(year='1993', month='13'),
+            dict(year='1993', month='0'),
+            dict(year='1993', month='2', day='29'),
+            dict(year='1993', month='2', day='x'),
+            dict(year='2015', week='54'),
+            dict(year='1993', week='53'),
+            dict(year='1993', week='6', weekday='8'),
+            dict(year='0', week='1'),
+            dict(year='-1', month='1'),
+        ):
+            with self.assertRaises(Http404):
+                fake_view(None, **kwargs)
+        # 2015 has a 53rd ISO week
+        fake_view(None, year='2015', week='53')
+
+    def test_invalid_combination(self):
+        """Ensures that unsupported argument combinations raise ValueError.
+        """
+        with self.assertRaises(ValueError):
+            fake_view(None, year='1993')
+        with self.assertRaises(ValueError):
+            fake_view(None, year='1993', month='2', week='6')
+
 
 class ConcreteType(Type):
     """
@@ -236,3 +325,1858 @@ class TypeTest(TestCase):
 
         with self.assertRaises(TypeError):
             ConcreteType.get({'cannot': 'pass', 'a': 'dict'})
+
+
+class GetOrCreateManyTest(TestCase):
+    """
+    Tests creating types in bulk.
+
+    """
+    fixtures = ['type_test']
+
+    def setUp(self):
+        """
+        Sets up the test fixture.
+
+        """
+        cache.clear()
+
+    def test_get_or_create_many(self):
+        """
+        Tests that existing types are found and missing types created
+        in a fixed number of queries, and that the results are cached.
+
+        """
+        with self.assertNumQueries(3):
+            types = ConcreteType.get_or_create_many(
+                ['FOO', 'bar', 'new1', 'New2', 'NEW1'],
+                defaults=lambda name: dict(description=name * 2)
+            )
+        self.assertEqual(types['FOO'].pk, 1)
+        self.assertEqual(types['bar'].pk, 2)
+        self.assertEqual(types['new1'], types['NEW1'])
+        self.assertEqual(types['New2'].description, 'New2New2')
+        self.assertEqual(ConcreteType.objects.count(), 5)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ConcreteType.get('New2'), types['New2'])
+            self.assertEqual(ConcreteType.get(types['New2'].pk),
+                             types['New2'])
+
+        with self.assertNumQueries(1):
+            again = ConcreteType.get_or_create_many(['new2', 'baz'])
+        self.assertEqual(again['new2'], types['New2'])
+
+    def test_duplicates(self):
+        """
+        Tests that the type with the lowest primary key is chosen when
+        a name has more than one.
+
+        """
+        ConcreteType.objects.create(name='Foo', description='again')
+        self.assertEqual(ConcreteType.get_or_create_many(['foo'])['foo'].pk, 1)
+        cache.clear()
+        self.assertEqual(ConcreteType.get('FOO').pk, 1)
+
+
+class ConcreteEffectiveRange(EffectiveRangeMixin):
+    """
+    A concrete model that extends `EffectiveRangeMixin`, used for
+    testing.
+
+    """
+    pass
+
+
+class RequestCacheTest(TestCase):
+    """
+    Tests the request-scoped memoisation helpers.
+
+    """
+    fixtures = ['type_test']
+
+    def test_request_cached(self):
+        """
+        Tests that `request_cached` provides a cache only for the
+        duration of the view.
+
+        """
+        @view_decorators.request_cached
+        def view(request):
+            return view_decorators.request_cache()
+
+        self.assertIsNone(view_decorators.request_cache())
+        self.assertEqual(view(None), {})
+        self.assertIsNone(view_decorators.request_cache())
+
+    def test_type_get(self):
+        """
+        Tests that `Type.get` is memoised inside a request.
+
+        """
+        @view_decorators.request_cached
+        def view(request):
+            first = ConcreteType.get('foo')
+            with self.assertNumQueries(0):
+                self.assertIs(ConcreteType.get('foo'), first)
+            return first
+
+        self.assertIsNot(view(None), view(None))
+
+    def test_at(self):
+        """
+        Tests that `EffectiveRangeMixin.at` is memoised inside a
+        request.
+
+        """
+        now = datetime.datetime.now()
+        ConcreteEffectiveRange.objects.create(effective_from=now)
+
+        @view_decorators.request_cached
+        def view(request):
+            first = ConcreteEffectiveRange.at(now)
+            self.assertEqual(len(first), 1)
+            with self.assertNumQueries(0):
+                second = ConcreteEffectiveRange.at(now)
+                self.assertIs(second, first)
+                self.assertEqual(len(second), 1)
+            return first
+
+        self.assertIsNot(view(None), view(None))
+        self.assertIsNot(
+            ConcreteEffectiveRange.at(now),
+            ConcreteEffectiveRange.at(now)
+        )
+
+
+class TestAttachable(models.Model, AttachableMixin):
+    """
+    An abstract attachable model, used for testing.
+
+    """
+    value = models.IntegerField()
+
+    class Meta(object):
+        abstract = True
+
+
+ConcreteTypeTestAttachable = TestAttachable.make_model(
+    ConcreteType,
+    app='lass_utils',
+    fkey=models.ForeignKey(ConcreteType)
+)
+
+
+class TestRangedAttachable(EffectiveRangeMixin, AttachableMixin):
+    """
+    An abstract attachable model with an effective range, used for
+    testing.
+
+    """
+    value = models.IntegerField()
+
+    class Meta(EffectiveRangeMixin.Meta):
+        abstract = True
+
+
+ConcreteTypeTestRangedAttachable = TestRangedAttachable.make_model(
+    ConcreteType,
+    app='lass_utils',
+    fkey=models.ForeignKey(ConcreteType)
+)
+
+
+# This is built when the app cache finishes loading, before syncdb.
+LazyTestAttachable = TestAttachable.make_model(
+    'LazyTarget',
+    app='lass_utils',
+    lazy=True
+)
+
+
+class AttachableTest(TestCase):
+    """
+    Tests the `AttachableMixin` model factory.
+
+    """
+    fixtures = ['type_test']
+
+    def test_make_model_memoised(self):
+        """
+        Tests that `make_model` returns the same model when called
+        again for the same target.
+
+        """
+        self.assertIs(
+            TestAttachable.make_model(
+                'ConcreteType',
+                app='lass_utils',
+                fkey=models.ForeignKey(ConcreteType)
+            ),
+            ConcreteTypeTestAttachable
+        )
+
+    def test_make_model_lazy(self):
+        """
+        Tests that `make_model` in lazy mode defers constructing the
+        model until it is used.
+
+        """
+        lazy = TestAttachable.make_model(
+            'UnusedTarget',
+            app='lass_utils',
+            lazy=True
+        )
+        self.assertIsInstance(lazy, LazyModel)
+        self.assertFalse(lazy.is_built())
+        self.assertEqual(lazy._meta.object_name, 'UnusedTargetTestAttachable')
+        self.assertTrue(lazy.is_built())
+        self.assertIs(
+            TestAttachable.make_model('UnusedTarget', app='lass_utils'),
+            lazy.model
+        )
+
+        other = TestAttachable.make_model(
+            'OtherUnusedTarget',
+            app='lass_utils',
+            lazy=True
+        )
+        build_pending_models()
+        self.assertTrue(other.is_built())
+
+    def test_lazy_model_loaded(self):
+        """
+        Tests that lazily made models are usable once the app cache has
+        loaded.
+
+        """
+        self.assertIsInstance(LazyTestAttachable, LazyModel)
+        self.assertTrue(LazyTestAttachable.is_built())
+        LazyTestAttachable.objects.create(value=1)
+        self.assertIsInstance(
+            LazyTestAttachable.objects.get(value=1),
+            LazyTestAttachable.model
+        )
+
+    def test_attachables_for(self):
+        """
+        Tests that `attachables_for` lists the attachables made for a
+        target.
+
+        """
+        for target in ConcreteType, 'ConcreteType':
+            self.assertEqual(
+                TestAttachable.attachables_for(target),
+                [ConcreteTypeTestAttachable]
+            )
+            self.assertEqual(
+                AttachableMixin.attachables_for(target),
+                [
+                    ConcreteTypeTestAttachable,
+                    ConcreteTypeTestRangedAttachable
+                ]
+            )
+        self.assertEqual(
+            AttachableMixin.attachables_for('NotATarget'),
+            []
+        )
+
+    def test_prefetch_attachables(self):
+        """
+        Tests that `prefetch_attachables` fetches each attachable in
+        one query and groups it by target.
+
+        """
+        now = datetime.datetime.now()
+        past = now - datetime.timedelta(days=2)
+        targets = list(ConcreteType.objects.order_by('pk'))
+        for target in targets:
+            ConcreteTypeTestAttachable.objects.create(
+                element=target,
+                value=target.pk
+            )
+            ConcreteTypeTestRangedAttachable.objects.create(
+                element=target,
+                value=target.pk,
+                effective_from=past,
+                effective_to=now - datetime.timedelta(days=1)
+            )
+        ConcreteTypeTestRangedAttachable.objects.create(
+            element=targets[0],
+            value=0,
+            effective_from=past
+        )
+
+        attachables = (
+            ConcreteTypeTestAttachable,
+            ConcreteTypeTestRangedAttachable
+        )
+        with self.assertNumQueries(2):
+            prefetch_attachables(targets, attachables, at=now)
+            for target in targets:
+                items = target.prefetched_attachables[
+                    ConcreteTypeTestAttachable
+                ]
+                self.assertEqual([i.value for i in items], [target.pk])
+                self.assertIs(items[0].element, target)
+        self.assertEqual(
+            [
+                [i.value for i in target.prefetched_attachables[
+                    ConcreteTypeTestRangedAttachable
+                ]]
+                for target in targets
+            ],
+            [[0], [], []]
+        )
+
+        # Profiling counts the attachables fetched, not the targets.
+        with profiling.Profile() as profile:
+            prefetch_attachables(targets[:2], attachables, at=now)
+        self.assertEqual(
+            profile.summary()['prefetch_attachables']['rows'],
+            3
+        )
+
+
+class ConcreteSubmittable(SubmittableMixin):
+    """
+    A concrete model that extends `SubmittableMixin`, used for testing.
+
+    """
+    submission_indexes = ('submitted', 'unsubmitted')
+
+    objects = submittable.submittable_manager()
+
+
+class ConcreteSubmittableRange(SubmittableMixin, EffectiveRangeMixin):
+    """
+    A concrete model that extends both `SubmittableMixin` and
+    `EffectiveRangeMixin`, used for testing.
+
+    """
+    objects = submittable.submittable_manager(effective_range.ERQuerySet)
+
+
+class SubmittableTest(TestCase):
+    """
+    Tests the `SubmittableMixin` model and its QuerySet.
+
+    """
+
+    def setUp(self):
+        """
+        Sets up the test fixture.
+
+        """
+        self.now = datetime.datetime(2013, 1, 1, 12, 0)
+        self.items = []
+        for days in 0, 1, 2, None:
+            item = ConcreteSubmittable.objects.create()
+            ConcreteSubmittable.objects.filter(pk=item.pk).update(
+                date_submitted=(
+                    None if days is None
+                    else self.now - datetime.timedelta(days=days)
+                )
+            )
+            self.items.append(item)
+
+    def test_submitted(self):
+        """
+        Tests `submitted` and `unsubmitted`.
+
+        """
+        self.assertEqual(
+            set(ConcreteSubmittable.objects.submitted()),
+            set(self.items[:3])
+        )
+        self.assertEqual(
+            list(ConcreteSubmittable.objects.unsubmitted()),
+            self.items[3:]
+        )
+
+    def test_submitted_between(self):
+        """
+        Tests that `submitted_between` includes the start of the window
+        but not the end.
+
+        """
+        self.assertEqual(
+            set(ConcreteSubmittable.objects.submitted_between(
+                self.now - datetime.timedelta(days=2),
+                self.now
+            )),
+            set(self.items[1:3])
+        )
+
+    def test_latest_submitted(self):
+        """
+        Tests `latest_submitted`.
+
+        """
+        self.assertEqual(
+            list(ConcreteSubmittable.objects.latest_submitted(2)),
+            self.items[:2]
+        )
+
+    def test_submit(self):
+        """
+        Tests that `submit` submits only unsubmitted items, in one
+        batch.
+
+        """
+        for item in self.items[1:]:
+            ConcreteSubmittable.objects.filter(pk=item.pk).update(
+                date_submitted=None
+            )
+        received = []
+
+        def receiver(sender, ids, date_submitted, **kwargs):
+            received.append((sender, sorted(ids), date_submitted))
+        submittable.submitted.connect(receiver)
+        try:
+            ids = ConcreteSubmittable.objects.exclude(
+                pk=self.items[1].pk
+            ).submit(at=self.now, send_signal=True)
+        finally:
+            submittable.submitted.disconnect(receiver)
+
+        expected = sorted(item.pk for item in self.items[2:])
+        self.assertEqual(sorted(ids), expected)
+        self.assertEqual(
+            received,
+            [(ConcreteSubmittable, expected, self.now)]
+        )
+        self.assertEqual(
+            list(ConcreteSubmittable.objects.unsubmitted()),
+            [self.items[1]]
+        )
+        self.assertEqual(
+            ConcreteSubmittable.objects.submitted_between(
+                self.now,
+                self.now + datetime.timedelta(seconds=1)
+            ).count(),
+            3
+        )
+        self.assertEqual(ConcreteSubmittable.objects.submit(), [
+            self.items[1].pk
+        ])
+
+    @unittest.skipIf(
+        sqlite3.sqlite_version_info < (3, 35, 0),
+        'SQLite is too old for UPDATE ... RETURNING'
+    )
+    def test_submit_returning(self):
+        """
+        Tests the single-statement submission used on PostgreSQL, which
+        newer SQLites also understand.
+
+        """
+        queryset = ConcreteSubmittable.objects.exclude(pk=self.items[0].pk)
+        ids = queryset._submit_returning(
+            queryset.unsubmitted(),
+            'default',
+            self.now
+        )
+        self.assertEqual(ids, [self.items[3].pk])
+        self.assertEqual(
+            ConcreteSubmittable.objects.get(pk=self.items[3].pk)
+            .date_submitted,
+            self.now
+        )
+        self.assertEqual(
+            ConcreteSubmittable.objects.get(pk=self.items[1].pk)
+            .date_submitted,
+            self.now - datetime.timedelta(days=1)
+        )
+
+    def test_submit_writes_to_primary(self):
+        """
+        Tests that `submit` reads and writes through the database
+        chosen for writing, not the one chosen for reading.
+
+        """
+        class MissingReplicaRouter(object):
+            def db_for_read(self, model, **hints):
+                return 'missing-replica'
+
+        routers_before = router.routers
+        router.routers = [MissingReplicaRouter()]
+        try:
+            ids = ConcreteSubmittable.objects.all().submit(at=self.now)
+        finally:
+            router.routers = routers_before
+        self.assertEqual(ids, [self.items[3].pk])
+        self.assertFalse(ConcreteSubmittable.objects.unsubmitted().exists())
+
+    def test_combined_with_effective_range(self):
+        """
+        Tests that a model combining `SubmittableMixin` and
+        `EffectiveRangeMixin` keeps the QuerySet methods of both.
+
+        """
+        early = ConcreteSubmittableRange.objects.create(
+            effective_from=self.now - datetime.timedelta(days=1)
+        )
+        ConcreteSubmittableRange.objects.create(
+            effective_from=self.now + datetime.timedelta(days=1)
+        )
+        ConcreteSubmittableRange.objects.filter(pk=early.pk).update(
+            date_submitted=None
+        )
+
+        self.assertEqual(list(ConcreteSubmittableRange.at(self.now)), [early])
+        self.assertEqual(
+            list(ConcreteSubmittableRange.objects.unsubmitted().at(self.now)),
+            [early]
+        )
+        self.assertEqual(
+            ConcreteSubmittableRange.objects.at(self.now).submit(at=self.now),
+            [early.pk]
+        )
+        self.assertIsInstance(
+            ConcreteSubmittableRange.objects.all(),
+            submittable.SubmittableERQuerySet
+        )
+
+    def test_index_names_truncated(self):
+        """
+        Tests that submission index names are shortened to fit the
+        backend's limit on identifier length, as Django's own are.
+
+        """
+        opts = ConcreteSubmittable._meta
+        table = opts.db_table
+        opts.db_table = 'lass_utils_' + 'x' * 50
+        connection.ops.max_name_length = lambda: 63
+        try:
+            names = [
+                name for name, _ in submittable.submission_index_sql(
+                    ConcreteSubmittable,
+                    connection
+                )
+            ]
+        finally:
+            del connection.ops.max_name_length
+            opts.db_table = table
+        self.assertEqual(len(names), 2)
+        for name in names:
+            self.assertLessEqual(len(name), 63)
+
+    def test_indexes(self):
+        """
+        Tests that the requested submission indexes are created.
+
+        """
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master"
+            " WHERE type = 'index' AND tbl_name = %s",
+            [ConcreteSubmittable._meta.db_table]
+        )
+        indexes = dict(cursor.fetchall())
+        table = ConcreteSubmittable._meta.db_table
+        self.assertIn(table + '_submitted', indexes)
+        self.assertIn('WHERE', indexes[table + '_unsubmitted'])
+
+
+class Rollback(Exception):
+    """
+    Raised to roll back a transaction in `NestedTransactionTest`.
+
+    """
+
+
+class NestedTransactionTest(TransactionTestCase):
+    """
+    Tests that helpers writing in bulk leave an enclosing transaction
+    for its owner to commit or roll back.
+
+    """
+
+    def test_submit(self):
+        """
+        Tests that `submit` does not commit the enclosing transaction.
+
+        """
+        try:
+            with transaction.commit_on_success():
+                item = ConcreteSubmittable.objects.create()
+                ConcreteSubmittable.objects.filter(pk=item.pk).update(
+                    date_submitted=None
+                )
+                self.assertEqual(
+                    ConcreteSubmittable.objects.submit(),
+                    [item.pk]
+                )
+                raise Rollback
+        except Rollback:
+            pass
+        self.assertFalse(ConcreteSubmittable.objects.exists())
+
+    def test_get_or_create_many(self):
+        """
+        Tests that `get_or_create_many` does not commit the enclosing
+        transaction.
+
+        """
+        try:
+            with transaction.commit_on_success():
+                ConcreteType.objects.create(name='before')
+                ConcreteType.get_or_create_many(['after'])
+                raise Rollback
+        except Rollback:
+            pass
+        self.assertFalse(ConcreteType.objects.exists())
+
+    def test_as_of(self):
+        """
+        Tests that an `AsOf` context does not commit the enclosing
+        transaction.
+
+        """
+        date = datetime.datetime(2013, 1, 1)
+        try:
+            with transaction.commit_on_success():
+                item = ConcreteEffectiveRange.objects.create(
+                    effective_from=date
+                )
+                with effective_range.AsOf(date, [ConcreteEffectiveRange]):
+                    self.assertEqual(
+                        list(ConcreteEffectiveRange.at(date)),
+                        [item]
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+        self.assertFalse(ConcreteEffectiveRange.objects.exists())
+
+
+class KeysetPaginatorTest(TestCase):
+    """
+    Tests the `KeysetPaginator` class.
+
+    """
+
+    def setUp(self):
+        """
+        Sets up the test fixture.
+
+        """
+        self.start = datetime.datetime(2013, 1, 1)
+        for day in 0, 1, 1, 1, 2, 3, 4:
+            ConcreteEffectiveRange.objects.create(
+                effective_from=self.start + datetime.timedelta(days=day)
+            )
+        ConcreteEffectiveRange.objects.create(effective_from=None)
+
+    def paginate(self, paginator):
+        """
+        Returns the contents of each page of the paginator.
+
+        """
+        pages = []
+        cursor = None
+        while True:
+            page = paginator.page(cursor)
+            pages.append(list(page))
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages(self):
+        """
+        Tests that pages cover every item once, in order.
+
+        """
+        for descending in True, False:
+            prefix = '-' if descending else ''
+            expected = list(ConcreteEffectiveRange.objects.filter(
+                effective_from__isnull=False
+            ).order_by(prefix + 'effective_from', prefix + 'pk'))
+            pages = self.paginate(KeysetPaginator(
+                ConcreteEffectiveRange.objects.all(),
+                2,
+                descending=descending
+            ))
+            self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+            self.assertEqual(sum(pages, []), expected)
+
+    def test_in_range(self):
+        """
+        Tests paginating a queryset filtered with `in_range`.
+
+        """
+        queryset = ConcreteEffectiveRange.objects.at(
+            self.start + datetime.timedelta(days=1)
+        )
+        pages = self.paginate(KeysetPaginator(queryset, 3))
+        self.assertEqual(sum(pages, []), list(queryset.order_by(
+            '-effective_from',
+            '-pk'
+        )))
+
+    def test_invalid_cursor(self):
+        """
+        Tests that malformed cursors raise InvalidPage.
+
+        """
+        paginator = KeysetPaginator(ConcreteEffectiveRange.objects.all(), 2)
+        for cursor in 'garbage', 'Zm9vfGJhcg==':
+            with self.assertRaises(InvalidPage):
+                paginator.page(cursor)
+
+
+class ProfilingTest(TestCase):
+    """
+    Tests the profiling hooks.
+
+    """
+    fixtures = ['type_test']
+
+    def test_profile(self):
+        """
+        Tests that a `Profile` records calls to profiled helpers.
+
+        """
+        now = datetime.datetime.now()
+        for _ in xrange(3):
+            ConcreteEffectiveRange.objects.create(effective_from=now)
+
+        with profiling.Profile() as profile:
+            ConcreteType.get_or_404('foo')
+            queryset = ConcreteEffectiveRange.at(now)
+            self.assertEqual(profile.records[-1][0], 'Type.get_or_404')
+            list(queryset)
+        self.assertFalse(profiling.enabled)
+        # Not recorded, as profiling is now off
+        list(ConcreteEffectiveRange.objects.in_range(now, now))
+
+        summary = profile.summary()
+        self.assertEqual(
+            sorted(summary),
+            ['ERQuerySet.at', 'Type.get', 'Type.get_or_404']
+        )
+        self.assertEqual(summary['Type.get']['rows'], 1)
+        self.assertEqual(summary['ERQuerySet.at']['calls'], 1)
+        self.assertEqual(summary['ERQuerySet.at']['queries'], 1)
+        self.assertEqual(summary['ERQuerySet.at']['rows'], 3)
+
+    def test_signal(self):
+        """
+        Tests that profiled helper calls are sent through
+        `helper_profiled` while profiling is enabled.
+
+        """
+        received = []
+
+        def receiver(sender, **kwargs):
+            received.append(sender)
+        profiling.helper_profiled.connect(receiver)
+        try:
+            ConcreteType.get('foo')
+            profiling.enable()
+            try:
+                ConcreteType.get('bar')
+            finally:
+                profiling.disable()
+        finally:
+            profiling.helper_profiled.disconnect(receiver)
+        self.assertEqual(received, ['Type.get'])
+
+    def test_chained(self):
+        """
+        Tests that QuerySets chained from a helper's result are
+        recorded against the helper.
+
+        """
+        now = datetime.datetime.now()
+        ConcreteEffectiveRange.objects.create(effective_from=now)
+        with profiling.Profile() as profile:
+            list(ConcreteEffectiveRange.at(now).order_by('pk'))
+            list(ConcreteEffectiveRange.objects.filter(
+                effective_to=None
+            ).in_range(now, now).select_related())
+        self.assertEqual(
+            [record[:3] for record in profile.records],
+            [('ERQuerySet.at', 1, 1), ('ERQuerySet.in_range', 1, 1)]
+        )
+
+    def test_threads(self):
+        """
+        Tests that profiling is on in every thread, and stays on until
+        every `enable` has been matched by a `disable`.
+
+        """
+        @profiling.profiled('select')
+        def select():
+            connection.cursor().execute('SELECT 1')
+
+        received = []
+
+        def receiver(sender, queries, **kwargs):
+            received.append(queries)
+
+        def run():
+            select()
+            connection.close()
+
+        profiling.helper_profiled.connect(receiver)
+        profiling.enable()
+        try:
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+            # Overlapping profiles, as of concurrent requests, each
+            # only undo their own enable.
+            first = profiling.Profile().__enter__()
+            second = profiling.Profile().__enter__()
+            first.__exit__(None, None, None)
+            self.assertTrue(profiling.enabled)
+            second.__exit__(None, None, None)
+            select()
+        finally:
+            profiling.disable()
+            profiling.helper_profiled.disconnect(receiver)
+        self.assertFalse(profiling.enabled)
+        self.assertEqual(received, [1, 1])
+
+
+class GeneratorsTest(TestCase):
+    """
+    Tests the synthetic data generators.
+
+    """
+
+    def test_generate_types(self):
+        """
+        Tests `generate_types`.
+
+        """
+        self.assertEqual(
+            generators.generate_types(ConcreteType, 25, chunk_size=10),
+            25
+        )
+        self.assertEqual(ConcreteType.objects.count(), 25)
+        self.assertEqual(ConcreteType.get('type24').name, 'type24')
+
+    def test_generate_effective_ranges(self):
+        """
+        Tests that `generate_effective_ranges` is reproducible and
+        produces contiguous ranges unless asked otherwise.
+
+        """
+        def generate(**kwargs):
+            ConcreteTypeTestRangedAttachable.objects.all().delete()
+            generators.generate_effective_ranges(
+                ConcreteTypeTestRangedAttachable,
+                10,
+                elements=[1, 2],
+                seed=42,
+                extra=lambda rng, index: dict(value=index),
+                chunk_size=3,
+                **kwargs
+            )
+            return [
+                list(ConcreteTypeTestRangedAttachable.objects.filter(
+                    element=element
+                ).order_by('value').values_list(
+                    'effective_from',
+                    'effective_to'
+                ))
+                for element in (1, 2)
+            ]
+
+        contiguous = generate()
+        self.assertEqual(contiguous, generate())
+        for ranges in contiguous:
+            self.assertEqual(len(ranges), 5)
+            for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, start)
+
+        for ranges in generate(gap_ratio=1.0, open_ratio=1.0):
+            self.assertIsNone(ranges[-1][1])
+            for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+                self.assertLess(end, start)
+
+    def test_generate_submittables(self):
+        """
+        Tests `generate_submittables`.
+
+        """
+        generators.generate_submittables(
+            ConcreteSubmittable,
+            100,
+            submitted_ratio=0.5,
+            seed=1
+        )
+        unsubmitted = ConcreteSubmittable.objects.unsubmitted().count()
+        self.assertTrue(20 < unsubmitted < 80)
+        self.assertEqual(
+            ConcreteSubmittable.objects.submitted_between(
+                generators.DEFAULT_START,
+                generators.DEFAULT_START + datetime.timedelta(days=366)
+            ).count(),
+            100 - unsubmitted
+        )
+
+
+class AggregationTest(TestCase):
+    """
+    Tests the time-bucketed aggregation functions.
+
+    """
+
+    def setUp(self):
+        """
+        Sets up the test fixture.
+
+        """
+        def at(day, hour=0):
+            return datetime.datetime(2013, 1, day, hour)
+        for element, effective_from, effective_to in (
+            (1, at(1), at(3)),          # Tue 1st to Thu 3rd
+            (1, at(2, 12), at(2, 18)),  # Six hours on Wed 2nd
+            (2, at(6), at(8)),          # Sun 6th to Tue 8th
+            (2, at(10), None),          # Thu 10th onwards
+            (2, None, None),            # Inert
+        ):
+            ConcreteTypeTestRangedAttachable.objects.create(
+                element_id=element,
+                value=0,
+                effective_from=effective_from,
+                effective_to=effective_to
+            )
+
+    def test_bucket_starts(self):
+        """
+        Tests `bucket_starts` at each granularity.
+
+        """
+        start = datetime.date(2013, 1, 2)
+        end = datetime.date(2013, 3, 1)
+        days = aggregation.bucket_starts(start, end, 'day')
+        self.assertEqual((days[0], days[-1], len(days)), (
+            start,
+            datetime.date(2013, 2, 28),
+            58
+        ))
+        weeks = aggregation.bucket_starts(start, end, 'week')
+        self.assertEqual(weeks[0], datetime.date(2012, 12, 31))
+        self.assertEqual(len(weeks), 9)
+        self.assertEqual(
+            aggregation.bucket_starts(start, end, 'month'),
+            [datetime.date(2013, 1, 1), datetime.date(2013, 2, 1)]
+        )
+        with self.assertRaises(ValueError):
+            aggregation.bucket_starts(start, end, 'fortnight')
+
+    def test_counts(self):
+        """
+        Tests counting the items effective in each bucket.
+
+        """
+        counts = aggregation.effective_totals(
+            ConcreteTypeTestRangedAttachable.objects.all(),
+            'day',
+            datetime.date(2013, 1, 1),
+            datetime.date(2013, 1, 12)
+        )
+        self.assertEqual(
+            [counts[datetime.date(2013, 1, day)] for day in xrange(1, 12)],
+            [1, 2, 0, 0, 0, 1, 1, 0, 0, 1, 1]
+        )
+
+        by_element = aggregation.effective_totals(
+            ConcreteTypeTestRangedAttachable.objects.all(),
+            'week',
+            datetime.date(2013, 1, 1),
+            datetime.date(2013, 1, 14),
+            group_by='element'
+        )
+        self.assertEqual(by_element, {
+            1: {datetime.date(2012, 12, 31): 2, datetime.date(2013, 1, 7): 0},
+            2: {datetime.date(2012, 12, 31): 1, datetime.date(2013, 1, 7): 2},
+        })
+
+    def test_durations(self):
+        """
+        Tests summing how long items were effective in each bucket.
+
+        """
+        durations = aggregation.effective_totals(
+            ConcreteTypeTestRangedAttachable.objects.all(),
+            'day',
+            datetime.date(2013, 1, 1),
+            datetime.date(2013, 1, 12),
+            measure='duration'
+        )
+        hours = dict(
+            (date.day, duration.days * 24 + duration.seconds // 3600)
+            for date, duration in durations.iteritems()
+        )
+        self.assertEqual(
+            [hours[day] for day in xrange(1, 12)],
+            [24, 30, 0, 0, 0, 24, 24, 0, 0, 24, 24]
+        )
+
+    def test_inverted(self):
+        """
+        Tests that items effective to before they are effective from
+        are ignored.
+
+        """
+        ConcreteTypeTestRangedAttachable.objects.create(
+            element_id=2,
+            value=0,
+            effective_from=datetime.datetime(2013, 1, 11),
+            effective_to=datetime.datetime(2013, 1, 4)
+        )
+        self.test_counts()
+        self.test_durations()
+
+
+class TimeUtilsTest(TestCase):
+    """
+    Tests the time utility functions.
+
+    """
+
+    def test_to_unix(self):
+        """
+        Tests that `to_unix` agrees with `calendar.timegm`.
+
+        """
+        class Offset(datetime.tzinfo):
+            def utcoffset(self, dt):
+                return datetime.timedelta(hours=-5, minutes=-30)
+
+            def dst(self, dt):
+                return datetime.timedelta(0)
+
+        for value in (
+            datetime.datetime(1993, 2, 13, 13, 50),
+            datetime.datetime(1969, 12, 31, 23, 59, 59, 500000),
+            datetime.datetime(2013, 3, 31, 1, 30, tzinfo=timezone.utc),
+            datetime.datetime(2013, 3, 31, 1, 30, 1, 5, tzinfo=Offset()),
+        ):
+            self.assertEqual(
+                time_utils.to_unix(value),
+                calendar.timegm(value.utctimetuple())
+            )
+
+    def test_range_unix(self):
+        """
+        Tests `range_start_unix` and `range_end_unix`.
+
+        """
+        item = ConcreteEffectiveRange(
+            effective_from=datetime.datetime(1970, 1, 2),
+            effective_to=datetime.datetime(1970, 1, 3)
+        )
+        self.assertEqual(item.range_start_unix(), 86400)
+        self.assertEqual(item.range_end_unix(), 2 * 86400)
+
+    @override_settings(USE_TZ=False)
+    def test_day_start_naive(self):
+        """
+        Tests `day_start` without time zone support.
+
+        """
+        self.assertEqual(
+            time_utils.day_bounds(datetime.date(2013, 3, 31)),
+            (datetime.datetime(2013, 3, 31), datetime.datetime(2013, 4, 1))
+        )
+
+    @unittest.skipIf(pytz is None, 'pytz is not installed')
+    @override_settings(USE_TZ=True)
+    def test_day_start_dst(self):
+        """
+        Tests that `day_start` handles daylight saving changes.
+
+        """
+        london = pytz.timezone('Europe/London')
+        start, end = time_utils.day_bounds(datetime.date(2013, 3, 31), london)
+        self.assertEqual(
+            start,
+            datetime.datetime(2013, 3, 31, tzinfo=timezone.utc)
+        )
+        self.assertEqual(end - start, datetime.timedelta(hours=23))
+        self.assertIs(
+            time_utils.day_start(datetime.date(2013, 3, 31), london),
+            start
+        )
+
+        # Midnight did not happen in Sao Paulo on this day.
+        self.assertEqual(
+            time_utils.day_start(
+                datetime.date(2013, 10, 20),
+                pytz.timezone('America/Sao_Paulo')
+            ),
+            datetime.datetime(2013, 10, 20, 3, tzinfo=timezone.utc)
+        )
+
+        # Midnight happened twice in Havana on this day.
+        self.assertEqual(
+            time_utils.day_start(
+                datetime.date(2012, 11, 4),
+                pytz.timezone('America/Havana')
+            ),
+            datetime.datetime(2012, 11, 4, 4, tzinfo=timezone.utc)
+        )
+
+
+class InvalidationTest(TestCase):
+    """
+    Tests the range-based cache invalidation subsystem.
+
+    """
+
+    def setUp(self):
+        """
+        Sets up the test fixture.
+
+        """
+        self.windows = []
+        self.cache = invalidation.PeriodCache('invalidation-test')
+        for listener in self, self.cache:
+            invalidation.register(listener, [ConcreteEffectiveRange])
+        self.addCleanup(invalidation.unregister, self)
+        self.addCleanup(invalidation.unregister, self.cache)
+
+    def invalidate(self, model, start, end):
+        """
+        Records an invalidation.
+
+        """
+        self.windows.append((model, start, end))
+
+    def day(self, day):
+        """
+        Returns midnight on the given day of January 2013.
+
+        """
+        return datetime.datetime(2013, 1, day)
+
+    def test_affected_window(self):
+        """
+        Tests `affected_window`.
+
+        """
+        self.assertEqual(
+            invalidation.affected_window(
+                (self.day(3), self.day(5)),
+                (self.day(1), self.day(2)),
+                (None, self.day(9)),
+                None
+            ),
+            (self.day(1), self.day(5))
+        )
+        self.assertEqual(
+            invalidation.affected_window(
+                (self.day(3), None),
+                (self.day(1), self.day(2))
+            ),
+            (self.day(1), None)
+        )
+        self.assertIsNone(invalidation.affected_window((None, None)))
+
+    def test_signals(self):
+        """
+        Tests that saving and deleting notify registered caches of the
+        affected windows.
+
+        """
+        item = ConcreteEffectiveRange.objects.create(
+            effective_from=self.day(3),
+            effective_to=self.day(5)
+        )
+        item.effective_from = self.day(4)
+        item.effective_to = self.day(8)
+        item.save()
+        item.delete()
+        ConcreteTypeTestRangedAttachable.objects.create(
+            element_id=1,
+            value=0,
+            effective_from=self.day(1)
+        )
+        self.assertEqual(self.windows, [
+            (ConcreteEffectiveRange, self.day(3), self.day(5)),
+            (ConcreteEffectiveRange, self.day(3), self.day(8)),
+            (ConcreteEffectiveRange, self.day(4), self.day(8)),
+        ])
+
+    def test_period_cache(self):
+        """
+        Tests that `PeriodCache` only drops the periods overlapping an
+        invalidated window.
+
+        """
+        for day in xrange(1, 10):
+            self.cache.set(self.day(day), day)
+        item = ConcreteEffectiveRange.objects.create(
+            effective_from=self.day(3),
+            effective_to=self.day(5)
+        )
+        self.assertEqual(
+            [self.cache.get(self.day(day)) for day in xrange(1, 10)],
+            [1, 2, None, None, None, 6, 7, 8, 9]
+        )
+        item.effective_to = None
+        item.save()
+        self.assertEqual(
+            [self.cache.get(self.day(day)) for day in xrange(1, 10)],
+            [1, 2, None, None, None, None, None, None, None]
+        )
+
+
+class SnapshotTest(TestCase):
+    """
+    Tests exporting and reading effective-range snapshots.
+
+    """
+
+    def setUp(self):
+        """
+        Sets up the test fixture.
+
+        """
+        def at(day, hour=0):
+            return datetime.datetime(2013, 1, day, hour)
+        for element, effective_from, effective_to in (
+            (2, at(6), at(8)),
+            (1, at(1), at(3, 12)),
+            (2, at(10), None),
+            (1, None, None),
+        ):
+            ConcreteTypeTestRangedAttachable.objects.create(
+                element_id=element,
+                value=element * 10,
+                effective_from=effective_from,
+                effective_to=effective_to
+            )
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'ranges.snapshot')
+
+    def test_export(self):
+        """
+        Tests that a snapshot holds the non-inert rows in order.
+
+        """
+        self.assertEqual(
+            snapshot.export_snapshot(
+                ConcreteTypeTestRangedAttachable.objects.all(),
+                self.path,
+                fields=('element', 'value')
+            ),
+            3
+        )
+        with snapshot.Snapshot(self.path) as exported:
+            self.assertEqual(len(exported), 3)
+            self.assertEqual(
+                list(exported.column('value')),
+                [10, 20, 20]
+            )
+            self.assertEqual(exported.row(0), {
+                'pk': 2,
+                'effective_from': datetime.datetime(2013, 1, 1),
+                'effective_to': datetime.datetime(2013, 1, 3, 12),
+                'element': 1,
+                'value': 10,
+            })
+            self.assertIsNone(exported.row(2)['effective_to'])
+
+        with self.assertRaises(ValueError):
+            snapshot.export_snapshot(
+                ConcreteType.objects.all(),
+                self.path,
+                fields=('name',)
+            )
+
+    def test_queries(self):
+        """
+        Tests that `at` and `in_range` on a snapshot agree with the
+        equivalent QuerySet methods.
+
+        """
+        queryset = ConcreteTypeTestRangedAttachable.objects.all()
+        snapshot.export_snapshot(queryset, self.path)
+        with snapshot.Snapshot(self.path) as exported:
+            for day in xrange(1, 13):
+                date = datetime.datetime(2013, 1, day, 6)
+                self.assertEqual(
+                    sorted(row['pk'] for row in
+                           exported.rows(exported.at(date))),
+                    sorted(queryset.at(date).values_list('pk', flat=True))
+                )
+            start = datetime.datetime(2013, 1, 11)
+            end = datetime.datetime(2014, 1, 1)
+            self.assertEqual(
+                [exported.row(index)['pk']
+                 for index in exported.in_range(start, end)],
+                [3]
+            )
+
+    def test_not_snapshot(self):
+        """
+        Tests that reading a file that is not a snapshot fails.
+
+        """
+        with open(self.path, 'wb') as other:
+            other.write('not a snapshot')
+        with self.assertRaises(ValueError):
+            snapshot.Snapshot(self.path)
+
+
+@override_settings(
+    LASS_REPLICA_DATABASES=('replica',),
+    LASS_REPLICA_MAX_LAG=1,
+    LASS_REPLICA_STICKY_SECONDS=5
+)
+class RoutersTest(TestCase):
+    """
+    Tests the read replica routing helpers.
+
+    """
+
+    def setUp(self):
+        """
+        Sets up the test fixture.
+
+        """
+        routers.unpin()
+        self.addCleanup(routers.unpin)
+        self.addCleanup(routers._lags.clear)
+
+    def set_lag(self, lag):
+        """
+        Pretends that the replica has just been measured as lagging by
+        the given number of seconds.
+
+        """
+        routers._lags['replica'] = (time.time(), lag)
+
+    def test_read_alias(self):
+        """
+        Tests that reads go to the replica unless pinned.
+
+        """
+        self.assertEqual(routers.read_alias(), 'replica')
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(ConcreteType), 'replica')
+        self.assertEqual(router.db_for_write(ConcreteType), 'default')
+        self.assertTrue(routers.is_pinned())
+        self.assertIsNone(routers.read_alias())
+        self.assertEqual(router.db_for_read(ConcreteType), 'default')
+
+    def test_max_lag(self):
+        """
+        Tests that lag-sensitive reads only use an up to date replica.
+
+        """
+        self.set_lag(0.5)
+        self.assertEqual(routers.read_alias(max_lag=1), 'replica')
+        self.assertEqual(ConcreteType._fill_queryset().db, 'replica')
+        self.set_lag(3)
+        self.assertEqual(routers.read_alias(max_lag=1), 'default')
+        self.assertEqual(ConcreteType._fill_queryset().db, 'default')
+        self.set_lag(None)
+        self.assertEqual(routers.read_alias(max_lag=1), 'default')
+        self.assertEqual(routers.read_alias(), 'replica')
+
+    def test_postgresql_lag_sql(self):
+        """
+        Tests that PostgreSQL lag is only measured from the last
+        replayed transaction while changes are waiting to be replayed,
+        using the function names of the server's version.
+
+        """
+        old = routers._postgresql_lag_sql(90603)
+        self.assertIn('pg_last_xlog_receive_location() = '
+                      'pg_last_xlog_replay_location() THEN 0', old)
+        new = routers._postgresql_lag_sql(100004)
+        self.assertIn('pg_last_wal_receive_lsn() = '
+                      'pg_last_wal_replay_lsn() THEN 0', new)
+
+    def test_helpers(self):
+        """
+        Tests the replica options of the effective range helpers.
+
+        """
+        date = datetime.datetime(2013, 1, 1)
+        self.assertEqual(
+            ConcreteEffectiveRange.at(date, replica=True).db,
+            'replica'
+        )
+        self.assertEqual(
+            ConcreteEffectiveRange.in_range(date, date, replica=True).db,
+            'replica'
+        )
+        self.assertEqual(ConcreteEffectiveRange.at(date).db, 'default')
+
+    def test_middleware(self):
+        """
+        Tests that pins are carried between requests in a cookie.
+
+        """
+        middleware = routers.ReplicaPinningMiddleware()
+        factory = RequestFactory()
+
+        request = factory.post('/')
+        middleware.process_request(request)
+        routers.pin()
+        response = middleware.process_response(request, HttpResponse())
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertFalse(routers.is_pinned())
+
+        request = factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = (
+            response.cookies[routers.PIN_COOKIE].value
+        )
+        middleware.process_request(request)
+        self.assertTrue(routers.is_pinned())
+        response = middleware.process_response(request, HttpResponse())
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+        # Pins from the client are capped at the sticky period.
+        request = factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = str(time.time() + 3600)
+        middleware.process_request(request)
+        self.assertLessEqual(routers.pinned_until(), time.time() + 5)
+        middleware.process_response(request, HttpResponse())
+
+
+class IntervalTest(TestCase):
+    """
+    Tests fetching effective ranges as lightweight intervals.
+
+    """
+
+    def test_as_intervals(self):
+        """
+        Tests that intervals hold the requested fields and implement
+        `DateRangeMixin`.
+
+        """
+        start = datetime.datetime(2013, 1, 1)
+        end = datetime.datetime(2013, 1, 3)
+        item = ConcreteTypeTestRangedAttachable.objects.create(
+            element_id=1,
+            value=42,
+            effective_from=start,
+            effective_to=end
+        )
+        intervals = list(
+            ConcreteTypeTestRangedAttachable.objects
+            .at(start)
+            .as_intervals('value')
+        )
+        self.assertEqual(len(intervals), 1)
+        interval = intervals[0]
+        self.assertEqual(
+            (interval.pk, interval.value),
+            (item.pk, 42)
+        )
+        self.assertEqual(interval.date_range(), item.date_range())
+        self.assertEqual(interval.range_duration(), datetime.timedelta(2))
+        self.assertEqual(interval.range_start_unix(), item.range_start_unix())
+        with self.assertRaises(AttributeError):
+            interval.unrequested = 1
+        self.assertIs(
+            type(interval),
+            ConcreteTypeTestRangedAttachable.objects.all()
+            .as_intervals('value').next().__class__
+        )
+
+
+class TemporalJoinTest(TestCase):
+    """
+    Tests joining effective-range querysets on overlapping ranges.
+
+    """
+
+    def setUp(self):
+        """
+        Sets up the test fixture.
+
+        """
+        def at(day):
+            return datetime.datetime(2013, 1, day) if day else None
+        self.items = {}
+        for name, element, value, effective_from, effective_to in (
+            ('a', 1, 0, 1, 5),
+            ('b', 1, 0, 5, None),
+            ('c', 2, 0, 1, 3),
+            ('d', 1, 1, 3, 6),      # Overlaps a and b
+            ('e', 1, 1, 7, 8),      # Overlaps b
+            ('f', 2, 1, 3, 4),      # Touches c, so does not overlap
+            ('g', 3, 1, 1, None),   # No element 3 on the left
+            ('h', 1, 1, None, 2),   # Inert
+        ):
+            self.items[name] = ConcreteTypeTestRangedAttachable.objects.create(
+                element_id=element,
+                value=value,
+                effective_from=at(effective_from),
+                effective_to=at(effective_to)
+            )
+
+    def test_methods(self):
+        """
+        Tests that both join methods give the expected pairs.
+
+        """
+        objects = ConcreteTypeTestRangedAttachable.objects
+        names = dict((item.pk, name) for name, item in self.items.items())
+        expected = [
+            ('a', 'd', datetime.datetime(2013, 1, 3),
+             datetime.datetime(2013, 1, 5)),
+            ('b', 'd', datetime.datetime(2013, 1, 5),
+             datetime.datetime(2013, 1, 6)),
+            ('b', 'e', datetime.datetime(2013, 1, 7),
+             datetime.datetime(2013, 1, 8)),
+        ]
+        for method in 'sql', 'merge':
+            pairs = effective_range.temporal_join(
+                objects.filter(value=0),
+                objects.filter(value=1),
+                'element',
+                method=method
+            )
+            self.assertEqual(
+                sorted((names[left.pk], names[right.pk], start, end)
+                       for left, right, start, end in pairs),
+                expected
+            )
+        with self.assertRaises(ValueError):
+            list(effective_range.temporal_join(
+                objects.all(),
+                objects.all(),
+                'element',
+                method='hash'
+            ))
+
+
+class CheckEffectiveRangesTest(TestCase):
+    """
+    Tests the ``check_effective_ranges`` management command.
+
+    """
+
+    def setUp(self):
+        """
+        Sets up the test fixture.
+
+        """
+        def at(day):
+            return datetime.datetime(2013, 1, day) if day else None
+        self.pks = {}
+        for name, element, effective_from, effective_to in (
+            ('a', 1, 1, 3),
+            ('b', 1, 3, 5),
+            ('c', 1, 4, None),      # Overlaps b
+            ('d', 1, 9, 10),        # Overlaps c
+            ('e', 2, 5, 2),         # Inverted
+            ('f', 2, 6, 8),
+            ('g', 2, None, 8),      # Inert with an end
+            ('h', 2, None, None),   # Inert
+        ):
+            self.pks[name] = ConcreteTypeTestRangedAttachable.objects.create(
+                element_id=element,
+                value=0,
+                effective_from=at(effective_from),
+                effective_to=at(effective_to)
+            ).pk
+
+    def test_report(self):
+        """
+        Tests that the report finds every problem, reading in small
+        chunks in a worker pool.
+
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'report.json')
+        call_command(
+            'check_effective_ranges',
+            'lass_utils.ConcreteTypeTestRangedAttachable',
+            workers=2,
+            chunk_size=2,
+            output=path
+        )
+        with open(path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(
+            (report['rows'], report['elements']),
+            (6, 2)
+        )
+        self.assertEqual(
+            report['counts'],
+            dict(overlap=2, inverted=1, inert=1)
+        )
+        self.assertEqual(
+            sorted(
+                (problem['type'], problem['key'], problem['pks'])
+                for problem in report['problems']
+            ),
+            [
+                ('inert', 2, [self.pks['g']]),
+                ('inverted', 2, [self.pks['e']]),
+                ('overlap', 1, [self.pks['b'], self.pks['c']]),
+                ('overlap', 1, [self.pks['c'], self.pks['d']]),
+            ]
+        )
+
+        report = check_effective_ranges.check_model(
+            ConcreteTypeTestRangedAttachable,
+            'element',
+            workers=1,
+            no_inert=True
+        )
+        self.assertEqual(report['counts']['inert'], 2)
+
+
+class RecurrenceTest(TestCase):
+    """
+    Tests the recurrence rules.
+
+    """
+
+    def window(self, start, end):
+        """
+        Returns the window between two (month, day) pairs in 2013.
+
+        """
+        return (
+            datetime.datetime(2013, start[0], start[1]),
+            datetime.datetime(2013, end[0], end[1])
+        )
+
+    def dates(self, rule, start=(1, 1), end=(2, 1)):
+        """
+        Returns the start dates of the slots a rule yields in the given
+        window.
+
+        """
+        return [
+            (slot.start.month, slot.start.day)
+            for slot in rule.slots(*self.window(start, end))
+        ]
+
+    def test_weekly(self):
+        """
+        Tests weekly rules, with intervals and exceptions.
+
+        """
+        eight = datetime.time(20)
+        two_hours = datetime.timedelta(hours=2)
+        self.assertEqual(
+            self.dates(recurrence.WeeklyRule(
+                2, eight, two_hours,
+                first=datetime.date(1990, 1, 1),
+                exceptions=[datetime.date(2013, 1, 15)]
+            )),
+            [(1, 1), (1, 8), (1, 22), (1, 29)]
+        )
+        self.assertEqual(
+            self.dates(recurrence.WeeklyRule(
+                2, eight, two_hours,
+                interval=2,
+                first=datetime.date(2012, 12, 25)
+            )),
+            [(1, 8), (1, 22)]
+        )
+        self.assertEqual(
+            self.dates(recurrence.WeeklyRule(
+                2, eight, two_hours,
+                last=datetime.date(2013, 1, 10)
+            )),
+            [(1, 1), (1, 8)]
+        )
+
+        # Slots from before the window that run into it are included.
+        late = recurrence.WeeklyRule(2, datetime.time(23), two_hours)
+        slot = next(late.slots(*self.window((1, 2), (1, 3))))
+        self.assertEqual(
+            slot.date_range(),
+            (datetime.datetime(2013, 1, 1, 23),
+             datetime.datetime(2013, 1, 2, 1))
+        )
+        self.assertEqual(slot.range_duration(), two_hours)
+
+    def test_monthly_and_iso_week(self):
+        """
+        Tests monthly and ISO week rules.
+
+        """
+        hour = datetime.timedelta(hours=1)
+        self.assertEqual(
+            self.dates(
+                recurrence.MonthlyRule(31, datetime.time(9), hour),
+                end=(5, 1)
+            ),
+            [(1, 31), (3, 31)]
+        )
+        self.assertEqual(
+            self.dates(
+                recurrence.ISOWeekRule(1, (1, 3), datetime.time(9), hour),
+                start=(1, 1),
+                end=(2, 1)
+            ),
+            [(1, 14)]
+        )
+        rule = recurrence.ISOWeekRule(1, (1, 53), datetime.time(9), hour)
+        self.assertEqual(
+            [slot.start.date() for slot in rule.slots(
+                datetime.datetime(2015, 12, 1),
+                datetime.datetime(2016, 2, 1)
+            )],
+            [datetime.date(2015, 12, 28), datetime.date(2016, 1, 4)]
+        )
+
+    def test_merge(self):
+        """
+        Tests merging slots with effective range items.
+
+        """
+        item = ConcreteEffectiveRange.objects.create(
+            effective_from=datetime.datetime(2013, 1, 3),
+            effective_to=datetime.datetime(2013, 1, 4)
+        )
+        ConcreteEffectiveRange.objects.create(
+            effective_from=datetime.datetime(2013, 2, 3),
+            effective_to=None
+        )
+        rule = recurrence.WeeklyRule(
+            2,
+            datetime.time(20),
+            datetime.timedelta(hours=2)
+        )
+        merged = list(recurrence.merge(
+            *self.window((1, 1), (1, 9)),
+            rules=[rule],
+            querysets=[ConcreteEffectiveRange.objects.all()]
+        ))
+        self.assertEqual(
+            [entry.range_start() for entry in merged],
+            [datetime.datetime(2013, 1, 1, 20),
+             datetime.datetime(2013, 1, 3),
+             datetime.datetime(2013, 1, 8, 20)]
+        )
+        self.assertEqual(merged[1], item)
+
+
+class LazyImportTest(TestCase):
+    """
+    Tests that the mixins and models packages import their contents
+    lazily.
+
+    """
+
+    def test_lazy_names(self):
+        """
+        Tests that lazily imported names resolve as before.
+
+        """
+        import lass_utils.mixins
+        import lass_utils.models
+        self.assertIs(lass_utils.mixins.EffectiveRangeMixin,
+                      EffectiveRangeMixin)
+        self.assertIs(lass_utils.models.Type, Type)
+        self.assertIn('SubmittableMixin', dir(lass_utils.mixins))
+        with self.assertRaises(AttributeError):
+            lass_utils.mixins.NoSuchMixin
+
+    def fresh_import(self, module, check):
+        """
+        Imports a module in a fresh interpreter, returning the result
+        of evaluating the expression check there afterwards.
+
+        """
+        code = (
+            'import sys\n'
+            'import {0}\n'
+            'sys.stdout.write(str({1}))\n'
+        ).format(module, check)
+        environment = dict(os.environ)
+        environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+        return subprocess.check_output(
+            [sys.executable, '-c', code],
+            env=environment
+        )
+
+    def test_fresh_import(self):
+        """
+        Tests that importing a mixin module in a fresh interpreter does
+        not import the ORM.
+
+        """
+        self.assertEqual(
+            self.fresh_import(
+                'lass_utils.mixins.date_range',
+                '"django.db.models" in sys.modules'
+            ),
+            'False'
+        )
+
+    def test_fresh_import_view_decorators(self):
+        """
+        Tests that importing `view_decorators` in a fresh interpreter
+        does not import Django.
+
+        """
+        self.assertEqual(
+            self.fresh_import(
+                'lass_utils.view_decorators',
+                'any(name.startswith("django") for name in sys.modules)'
+            ),
+            'False'
+        )
+
+
+class AsOfTest(TestCase):
+    """
+    Tests reading several effective-range models as of one instant.
+
+    """
+
+    def test_as_of(self):
+        """
+        Tests that `at` calls in an `AsOf` context are answered from
+        the context, without further queries.
+
+        """
+        date = datetime.datetime(2013, 1, 2)
+        item = ConcreteEffectiveRange.objects.create(
+            effective_from=datetime.datetime(2013, 1, 1),
+            effective_to=None
+        )
+        ConcreteTypeTestRangedAttachable.objects.create(
+            element_id=1,
+            value=0,
+            effective_from=datetime.datetime(2013, 1, 3)
+        )
+        with self.assertNumQueries(2):
+            with effective_range.AsOf(date, [
+                ConcreteEffectiveRange,
+                ConcreteTypeTestRangedAttachable
+            ]) as context:
+                self.assertIs(effective_range.active_as_of(date), context)
+                self.assertEqual(list(ConcreteEffectiveRange.at(date)),
+                                 [item])
+                self.assertEqual(
+                    list(ConcreteTypeTestRangedAttachable.at(date)),
+                    []
+                )
+                self.assertIs(ConcreteEffectiveRange.at(date),
+                              ConcreteEffectiveRange.at(date))
+                self.assertIsNone(effective_range.active_as_of(
+                    datetime.datetime(2013, 1, 3)
+                ))
+        self.assertIsNone(effective_range.active_as_of(date))
+
+        # Models not given up front are fetched when first asked for.
+        with effective_range.AsOf(date):
+            with self.assertNumQueries(1):
+                self.assertEqual(list(ConcreteEffectiveRange.at(date)),
+                                 [item])
+                list(ConcreteEffectiveRange.at(date))
@@ -0,0 +1,117 @@
+"""
+Time utilities
+--------------
+
+This module contains the date and time conversions shared by the
+mixins and view decorators in ``lass_utils``: finding the instant a
+local day starts, and converting datetimes to UNIX timestamps.
+
+Day boundaries are cached per date and time zone, as feeds and
+listings tend to ask for the same few days over and over.
+
+"""
+
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+
+#: The UNIX epoch, as an aware datetime.
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_NAIVE_EPOCH = EPOCH.replace(tzinfo=None)
+
+# Maps (date, time zone) onto the start of that date in that zone.
+_day_starts = {}
+
+#: The number of day boundaries cached before the cache is emptied.
+DAY_START_CACHE_SIZE = 4096
+
+
+def local_today(tz=None):
+    """
+    Returns today's date in the given time zone (by default, the
+    current time zone), or in local time if time zone support is off.
+
+    """
+    if not settings.USE_TZ:
+        return datetime.date.today()
+    if tz is None:
+        tz = timezone.get_current_timezone()
+    return timezone.now().astimezone(tz).date()
+
+
+def day_start(date, tz=None):
+    """
+    Returns the first instant of the given date.
+
+    If time zone support is on, this is an aware datetime (in UTC) for
+    midnight in the given time zone, defaulting to the current time
+    zone.  On days where midnight is skipped by a daylight saving
+    change, it is the first instant that does exist; where midnight is
+    repeated, it is the first of the two.  If time zone
+    support is off, this is a naive datetime for midnight.
+
+    """
+    if not settings.USE_TZ:
+        return datetime.datetime(date.year, date.month, date.day)
+    if tz is None:
+        tz = timezone.get_current_timezone()
+
+    key = (date, tz)
+    try:
+        return _day_starts[key]
+    except KeyError:
+        pass
+
+    midnight = datetime.datetime(date.year, date.month, date.day)
+    if hasattr(tz, 'localize'):
+        # pytz time zones: localize picks the right offset.  Where a
+        # daylight saving change repeats midnight, the first (daylight
+        # saving) one starts the day; where it skips midnight,
+        # normalize moves it to the actual start.
+        import pytz
+        try:
+            start = tz.localize(midnight, is_dst=None)
+        except pytz.AmbiguousTimeError:
+            start = tz.localize(midnight, is_dst=True)
+        except pytz.NonExistentTimeError:
+            start = tz.normalize(tz.localize(midnight, is_dst=False))
+    else:
+        start = midnight.replace(tzinfo=tz)
+    start = start.astimezone(timezone.utc)
+
+    if len(_day_starts) >= DAY_START_CACHE_SIZE:
+        _day_starts.clear()
+    _day_starts[key] = start
+    return start
+
+
+def day_bounds(date, tz=None):
+    """
+    Returns the first instant of the given date and of the date after,
+    as given by :func:`day_start`.
+
+    """
+    return day_start(date, tz), day_start(
+        date + datetime.timedelta(days=1),
+        tz
+    )
+
+
+def to_unix(value):
+    """
+    Returns a datetime as a whole number of seconds since the UNIX
+    epoch, rounding down.
+
+    Naive datetimes are taken to be in UTC.  This gives the same result
+    as ``calendar.timegm(value.utctimetuple())``, without building a
+    time tuple.
+
+    """
+    if value.tzinfo is None or value.utcoffset() is None:
+        delta = value - _NAIVE_EPOCH
+    else:
+        delta = value - EPOCH
+    return delta.days * 86400 + delta.seconds
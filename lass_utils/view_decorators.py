@@ -5,6 +5,9 @@ Other functions too?
 """
 
 import datetime
+import functools
+import re
+import threading
 
 
 def date_normalise(view):
@@ -34,33 +37,256 @@ def date_normalise(view):
                  weekday=None,
                  month=None,
                  day=None):
-        if start:
-            # Strip any time information
-            if hasattr(start, 'date'):
-                start = start.date()
-        else:
-            if year and month:
-                start = datetime.date(
-                    int(year),
-                    int(month),
-                    int(day) if day else 1  # Default to the 1st
-                )
-            elif year and week:
-                start = iso_to_gregorian(
-                    int(year),
-                    int(week),
-                    int(weekday) if weekday else 1  # Default to Monday
-                )
-            elif not any([start, year, week, weekday, month, day]):
-                start = datetime.date.today()
-            else:
-                raise ValueError(
-                    "Incorrect combination of arguments to view."
-                )
-        return view(request, start)
+        return view(
+            request,
+            parse_date_arguments(start, year, week, weekday, month, day)
+        )
     return new_view
 
 
+## Date argument parsing
+
+## URL keyword arguments arrive as strings of digits.  Anything that
+## is not one, or that does not name a real date, raises Http404 so that
+## crawlers poking at bad date URLs get a cheap 404 rather than a 500.
+
+## Django's HTTP machinery (and its time zone support, for today's
+## date) is only imported on the paths that need it, so that importing
+## this module stays cheap for workers that never serve requests.
+
+_DIGITS = re.compile(r'[0-9]{1,4}\Z')
+
+
+def _not_found(message):
+    """Returns an Http404 with the given message, to be raised."""
+    from django.http import Http404
+    return Http404(message)
+
+
+def _to_int(name, value, lowest, highest):
+    """Converts one URL date argument to an integer within bounds.
+
+    Raises:
+        Http404: if the value is not an integer in [lowest, highest].
+    """
+    if not isinstance(value, (int, long)):
+        if not _DIGITS.match(value):
+            raise _not_found(u'Malformed {0} in date.'.format(name))
+        value = int(value)
+    if not lowest <= value <= highest:
+        raise _not_found(u'{0} out of range in date.'.format(name))
+    return value
+
+
+# The lengths of the months in a common year.  (The calendar module
+# would pull in locale support just for these.)
+_MONTH_DAYS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _days_in_month(year, month):
+    """Returns the number of days in the given month."""
+    if month == 2 and year % 4 == 0 and (year % 100 or year % 400 == 0):
+        return 29
+    return _MONTH_DAYS[month - 1]
+
+
+def _year_month_day(year, week, weekday, month, day):
+    """Parses the year/month(/day) date argument shapes."""
+    year = _to_int('year', year, datetime.MINYEAR, datetime.MAXYEAR)
+    month = _to_int('month', month, 1, 12)
+    if day is None:
+        return datetime.date(year, month, 1)  # Default to the 1st
+    return datetime.date(
+        year,
+        month,
+        _to_int('day', day, 1, _days_in_month(year, month))
+    )
+
+
+def _year_week_weekday(year, week, weekday, month, day):
+    """Parses the year/week(/weekday) date argument shapes."""
+    year = _to_int('year', year, datetime.MINYEAR, datetime.MAXYEAR)
+    week = _to_int('week', week, 1, iso_weeks_in_year(year))
+    weekday = (
+        1 if weekday is None  # Default to Monday
+        else _to_int('weekday', weekday, 1, 7)
+    )
+    try:
+        return iso_to_gregorian(year, week, weekday)
+    except OverflowError:
+        # The first and last ISO weeks of the calendar can spill
+        # outside the range datetime.date supports.
+        raise _not_found(u'Date out of range.')
+
+
+# Maps which of (year, week, weekday, month, day) are present onto the
+# parser for that shape.
+_SHAPES = {
+    (True, False, False, True, True): _year_month_day,
+    (True, False, False, True, False): _year_month_day,
+    (True, True, True, False, False): _year_week_weekday,
+    (True, True, False, False, False): _year_week_weekday,
+}
+
+
+def parse_date_arguments(start=None,
+                         year=None,
+                         week=None,
+                         weekday=None,
+                         month=None,
+                         day=None):
+    """Converts the keyword arguments accepted by date_normalise to a date.
+
+    Args:
+        start: a date or datetime, which overrides all other arguments.
+        year, week, weekday, month, day: integers or strings of digits,
+            given in one of the combinations year/month/day, year/month,
+            year/week/weekday or year/week.  Empty strings count as
+            missing arguments.
+
+    Returns:
+        the date represented by the arguments, or today's date (in the
+        current time zone) if no arguments are given.
+
+    Raises:
+        Http404: if the arguments do not represent a valid date.
+        ValueError: if the arguments are given in an unsupported
+            combination, which indicates a problem with the URLconf.
+    """
+    # Fast paths for the most common cases
+    if start:
+        # Strip any time information
+        return start.date() if hasattr(start, 'date') else start
+    args = tuple(
+        None if arg == '' else arg
+        for arg in (year, week, weekday, month, day)
+    )
+    try:
+        parser = _SHAPES[tuple(arg is not None for arg in args)]
+    except KeyError:
+        if not any(arg is not None for arg in args):
+            from lass_utils.time_utils import local_today
+            return local_today()
+        raise ValueError(
+            "Incorrect combination of arguments to view."
+        )
+    return parser(*args)
+
+
+## Request-scoped memoisation
+
+## The request cache is a plain dictionary that lives for exactly one
+## request.  Model helpers (for example Type.get) look in it before
+## hitting the database or the shared cache; because it is thrown
+## away when the request ends, nothing stored in it can go stale
+## across requests.
+
+_request_local = threading.local()
+
+
+def request_cache():
+    """Returns the cache dictionary for the current request.
+
+    Returns:
+        the active request cache, or None if no request cache has been
+        set up (for example, outside of a request or in a view that is
+        not decorated with request_cached).
+    """
+    return getattr(_request_local, 'cache', None)
+
+
+def request_memoise(key, function, *args, **kwargs):
+    """Memoises a function call for the duration of the current request.
+
+    If no request cache is active, the function is simply called.
+    Exceptions raised by the function are not memoised.
+
+    Args:
+        key: a hashable key identifying the call; it must be unique
+            across everything stored in the request cache.
+        function: the function to call on a cache miss.
+        *args, **kwargs: the arguments to pass to the function.
+
+    Returns:
+        the (possibly memoised) result of calling the function.
+    """
+    cache = request_cache()
+    if cache is None:
+        return function(*args, **kwargs)
+    try:
+        result = cache[key]
+    except KeyError:
+        result = cache[key] = function(*args, **kwargs)
+    return result
+
+
+def begin_request_cache():
+    """Starts a request cache if one is not already active.
+
+    Returns:
+        True if a new request cache was created, in which case the
+        caller is responsible for calling end_request_cache; False if
+        one was already active.
+    """
+    if request_cache() is not None:
+        return False
+    _request_local.cache = {}
+    return True
+
+
+def end_request_cache():
+    """Throws away the active request cache, if any."""
+    _request_local.cache = None
+
+
+def request_cached(view):
+    """A view decorator that gives the view a request cache.
+
+    Helpers called by the view (and by anything it renders) that use
+    request_memoise will only do their work once per request.  If a
+    request cache is already active (for example, because of
+    RequestCacheMiddleware), that cache is reused.
+
+    Args:
+        view: the view function to decorate.
+
+    Returns:
+        the decorated view.
+    """
+    @functools.wraps(view)
+    def new_view(request, *args, **kwargs):
+        created = begin_request_cache()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            if created:
+                end_request_cache()
+    return new_view
+
+
+class RequestCacheMiddleware(object):
+    """Middleware giving every request its own request cache.
+
+    This is the project-wide equivalent of request_cached.
+    """
+
+    def process_request(self, request):
+        """Starts the request cache."""
+        request._lass_request_cache = begin_request_cache()
+
+    def process_response(self, request, response):
+        """Throws away the request cache."""
+        if getattr(request, '_lass_request_cache', False):
+            end_request_cache()
+        return response
+
+    def process_exception(self, request, exception):
+        """Throws away the request cache."""
+        if getattr(request, '_lass_request_cache', False):
+            end_request_cache()
+            request._lass_request_cache = False
+
+
 ## Helper functions
 
 ## These next two functions were purloined from
@@ -82,3 +308,31 @@ def iso_to_gregorian(iso_year, iso_week, iso_day):
         days=iso_day-1,
         weeks=iso_week-1
     )
+
+
+def iso_weeks_in_year(iso_year):
+    """The number of weeks (52 or 53) in the given ISO year.
+    """
+    # The 28th of December is always in the last week of its ISO year.
+    return datetime.date(iso_year, 12, 28).isocalendar()[1]
+
+
+def week_start(date):
+    """The Monday of the ISO week containing the given date.
+    """
+    iso_year, iso_week, _ = date.isocalendar()
+    return iso_to_gregorian(iso_year, iso_week, 1)
+
+
+def month_start(date):
+    """The first day of the month containing the given date.
+    """
+    return date.replace(day=1)
+
+
+def next_month_start(date):
+    """The first day of the month after the one containing the given date.
+    """
+    if date.month == 12:
+        return datetime.date(date.year + 1, 1, 1)
+    return datetime.date(date.year, date.month + 1, 1)